@@ -0,0 +1,605 @@
+# This module is the headless core of the absolon tetris engine.
+#
+# It knows nothing about pygame. The playfield state is a small integer grid
+# (one uint8 per cell) and the tetrominoes are static coordinate data. The
+# pygame frontend (absolutris) renders this state as a view, but simulations,
+# replay analysis and machine learning jobs can run the engine without SDL.
+#
+# 1. Cells
+#
+#   A cell of the grid is 0 when it is empty. An occupied cell holds the
+#   number of the tetromino which occupies it plus one, so 1 is I and 7 is Z.
+#   Cells of garbage rows pushed up from the bottom are 8.
+#   Rows are counted from the top of the playfield, columns from the left,
+#   exactly like the tiles of the Playfield in absolutris.
+#
+#   The Board counts the occupied cells of every row, so full rows are found
+#   without scanning the grid. Line clears and garbage only move the rows
+#   which actually move, and the Board can log these moves for a view which
+#   scrolls its image instead of redrawing the moved cells.
+#
+# 2. Shapes
+#
+#   Every tetromino is defined by the (forward, left) coordinates of its four
+#   minoes, mino 0 being the origin (0, 0). A rotation turns these coordinates
+#   into (column, row) offsets relative to the origin, see rotate_mino().
+#
+# 3. Placements
+#
+#   The absolutris controls are absolute: a placement is a rotation (0-3) and
+#   a column (0-9). The column is the leftmost column the rotated tetromino
+#   occupies. The tetromino is dropped straight down from above the playfield
+#   until it rests on the stack or the floor.
+#
+#   Bots evaluate every placement of every tetromino, at most 40 of them.
+#   enumerate_placements() computes all of them at once from the column
+#   surfaces of the board and the bottoms of the rotated tetrominoes, and
+#   returns the landing rows, the cleared lines and the resulting boards.
+#
+# 4. Features
+#
+#   The Board keeps a feature vector of its grid for machine learning
+#   observations, up to date after every lock, line clear and garbage row.
+#   Its layout is fixed for a board width, see feature_names():
+#
+#     heights           one per column, rows above the floor up to the
+#                       topmost occupied cell
+#     holes             empty cells below the topmost occupied cell of
+#                       their column
+#     bumpiness         sum of the height differences of adjacent columns
+#     wells             sum of the depths of the columns which are lower
+#                       than both neighbours, the walls being as high as
+#                       the playfield
+#     row transitions   changes between occupied and empty cells along the
+#                       rows, the walls counting as occupied
+#
+#   A lock only changes the columns and rows of its four cells, and a line
+#   clear lowers the columns by the number of cleared lines, so the Board
+#   updates the holes per column and the transitions per row instead of
+#   recomputing them. board_features() computes the same vector for a stack
+#   of grids at once.
+#
+# 5. Inputs
+#
+#   Everything a player can do to a game is one input byte, see the INPUT
+#   constants below. The frontend turns key presses into inputs, and replays
+#   record inputs, so a game can be re-simulated without the frontend.
+
+import logging
+import logging_conf
+import numpy as np
+from collections import namedtuple
+from functools import lru_cache
+from typing import Optional, Tuple
+
+
+# Setup logging
+logging_conf.configure()
+logger = logging.getLogger(__name__)
+
+
+# Numbers of the tetrominoes, matching old_tetrominoes.mapping and the
+# integers produced by the random sources of the generator
+I, J, L, O, S, T, Z = range(7)
+PIECE_NAMES = "IJLOSTZ"
+# characters of the cells in Board.__str__
+CELL_NAMES = "." + PIECE_NAMES + "#"
+
+# (forward, left) coordinates of the four minoes of each tetromino
+SHAPES = {I: ((0, 0), (0, 1), (0, 2), (0, -1)),
+          J: ((0, 0), (0, 1), (0, -1), (1, 1)),
+          L: ((0, 0), (0, 1), (0, -1), (1, -1)),
+          O: ((0, 0), (0, 1), (-1, 0), (-1, 1)),
+          S: ((0, 0), (0, -1), (-1, 0), (-1, 1)),
+          T: ((0, 0), (0, 1), (0, -1), (1, 0)),
+          Z: ((0, 0), (0, 1), (-1, 0), (-1, -1)),
+          }
+
+# Rows a tetromino is shifted by when it spawns
+SPAWN_OFFSETS = {I: 0, J: -1, L: -1, O: 0, S: 0, T: -1, Z: 0}
+
+EMPTY = 0
+GARBAGE = 8
+
+# (column, row) = (a * forward + b * left, c * forward + d * left) for n times 90°
+ROTATION_MATRICES = ((0, 1, 1, 0),
+                     (1, 0, 0, -1),
+                     (0, -1, -1, 0),
+                     (-1, 0, 0, 1),
+                     )
+
+
+def rotate_mino(forward: int, left: int, rotation: int) -> Tuple[int, int]:
+    """
+    Returns the (column, row) offset of a mino after rotating it
+    by n times 90°.
+    """
+    a, b, c, d = ROTATION_MATRICES[rotation]
+    return a * forward + b * left, c * forward + d * left
+
+
+Cell = namedtuple("Cell", "column, row")
+# Everything about a tetromino in one of its rotations:
+#     cells - (column, row) of the minoes relative to the origin mino
+#     offsets - (column, row) of the minoes relative to the top left corner of the bounding box
+#     min_column, min_row - position of the bounding box relative to the origin mino
+#     width, height - size of the bounding box
+#     bottoms - lowest row offset of the minoes in each column of the bounding box
+#     spawn_offset - rows the tetromino is shifted by when it spawns
+Rotation = namedtuple("Rotation", "piece, rotation, cells, offsets, min_column, min_row, width, height, bottoms, spawn_offset")
+
+
+def build_rotation(piece: int, rotation: int) -> Rotation:
+    cells = tuple(Cell(*rotate_mino(forward, left, rotation)) for forward, left in SHAPES[piece])
+    min_column = min(cell.column for cell in cells)
+    min_row = min(cell.row for cell in cells)
+    offsets = tuple(Cell(cell.column - min_column, cell.row - min_row) for cell in cells)
+    width = max(offset.column for offset in offsets) + 1
+    height = max(offset.row for offset in offsets) + 1
+    bottoms = tuple(max(offset.row for offset in offsets if offset.column == column) for column in range(width))
+    return Rotation(piece, rotation, cells, offsets, min_column, min_row, width, height, bottoms, SPAWN_OFFSETS[piece])
+
+
+# ROTATIONS[piece][rotation], computed once at import
+ROTATIONS = tuple(tuple(build_rotation(piece, rotation) for rotation in range(4)) for piece in range(7))
+
+
+def read_only(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
+
+
+# The same tables as NumPy arrays for vectorized code, indexed [piece, rotation, ...]
+OFFSETS = read_only(np.array([[r.offsets for r in rotations] for rotations in ROTATIONS], dtype=np.int64))
+WIDTHS = read_only(np.array([[r.width for r in rotations] for rotations in ROTATIONS], dtype=np.int64))
+HEIGHTS = read_only(np.array([[r.height for r in rotations] for rotations in ROTATIONS], dtype=np.int64))
+# lowest mino in each column of the bounding box, -1 for columns beyond the width
+BOTTOMS = read_only(np.array([[r.bottoms + (-1,) * (4 - r.width) for r in rotations] for rotations in ROTATIONS], dtype=np.int64))
+MIN_ROWS = read_only(np.array([[r.min_row for r in rotations] for rotations in ROTATIONS], dtype=np.int64))
+# the rotations of each tetromino whose shape differs from all lower rotations, e.g. (0,) for O
+DISTINCT_ROTATIONS = tuple(tuple(r.rotation for r in rotations if all(set(r.offsets) != set(other.offsets) for other in rotations[:r.rotation]))
+                           for rotations in ROTATIONS)
+
+
+def piece_cells(piece: int, rotation: int) -> Tuple[Cell, ...]:
+    """
+    Returns the (column, row) offsets of the four minoes of a tetromino
+    relative to its origin mino.
+    """
+    return ROTATIONS[piece][rotation].cells
+
+
+Placement = namedtuple("Placement", "piece, rotation, column, row, lines")
+# All placements of a tetromino on a board, as arrays with one entry per placement:
+#     rotations, columns - the absolute placement
+#     rows - row of the origin mino where the tetromino comes to rest, as in Placement
+#     tops - row of the top of its bounding box
+#     lines - number of lines the placement clears
+#     boards - (placements, rows, columns) grids after locking the tetromino and clearing the lines
+Placements = namedtuple("Placements", "piece, rotations, columns, rows, tops, lines, boards")
+
+
+def column_surfaces(grids: np.ndarray) -> np.ndarray:
+    """
+    Returns the row of the topmost occupied cell of every column of one
+    grid or a stack of grids, or the number of rows for empty columns.
+    """
+    occupied = grids != EMPTY
+    rows = grids.shape[-2]
+    return np.where(occupied.any(axis=-2), occupied.argmax(axis=-2), rows)
+
+
+def landing_tops(surfaces: np.ndarray, rows: int, pieces, rotations: np.ndarray, columns: np.ndarray) -> np.ndarray:
+    """
+    Returns the row of the top of the bounding box at which each tetromino
+    comes to rest when dropped from above with its leftmost mino in the given
+    column. surfaces holds the column_surfaces of the board each tetromino is
+    dropped on, one row per tetromino. A negative row means it does not fit.
+    """
+    bottoms = BOTTOMS[pieces, rotations]
+    piece_columns = np.minimum(columns[:, None] + np.arange(4), surfaces.shape[-1] - 1)
+    surfaces = np.take_along_axis(surfaces, piece_columns, axis=1)
+    # row of the top of the bounding box at which each column of the tetromino touches down
+    touchdown = np.where(bottoms >= 0, surfaces - bottoms - 1, rows)
+    return touchdown.min(axis=1)
+
+
+def clear_full_rows(boards: np.ndarray) -> np.ndarray:
+    """
+    Removes the full rows of a stack of boards in place, moving the rows
+    above them down, and returns the number of cleared lines per board.
+    """
+    full = np.all(boards != EMPTY, axis=2)
+    cleared = full.sum(axis=1)
+    if cleared.any():
+        # stable sort moves full rows to the top, keeping the order of the others
+        order = np.argsort(~full, axis=1, kind="stable")
+        boards[:] = np.take_along_axis(boards, order[:, :, None], axis=1)
+        boards[np.arange(boards.shape[1])[None, :] < cleared[:, None]] = EMPTY
+    return cleared
+
+
+@lru_cache(maxsize=None)
+def candidate_placements(piece: int, columns: int, distinct: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the rotations and columns of all placements
+    of a tetromino within the walls of a board.
+    """
+    rotations = DISTINCT_ROTATIONS[piece] if distinct else range(4)
+    pairs = [(rotation, column) for rotation in rotations for column in range(columns - ROTATIONS[piece][rotation].width + 1)]
+    return tuple(read_only(np.array(values, dtype=np.int64)) for values in zip(*pairs))
+
+
+def enumerate_placements(board: "Board", piece, distinct: bool = False) -> Placements:
+    """
+    Returns every placement of a tetromino which fits on the board, computed
+    for all rotations and columns at once. piece is the number of a
+    tetromino or a class or instance from old_tetrominoes.mapping.
+    With distinct, rotations which give the same shape as a lower one are left out.
+    """
+    piece = int(getattr(piece, "piece", piece))
+    rotations, columns = candidate_placements(piece, board.columns, distinct)
+    surfaces = np.broadcast_to(column_surfaces(board.grid), (rotations.size, board.columns))
+    tops = landing_tops(surfaces, board.rows, piece, rotations, columns)
+    fits = tops >= 0
+    rotations, columns, tops = rotations[fits], columns[fits], tops[fits]
+    offsets = OFFSETS[piece, rotations]
+    boards = np.repeat(board.grid[None], rotations.size, axis=0)
+    boards[np.repeat(np.arange(rotations.size), 4),
+           (tops[:, None] + offsets[..., 1]).ravel(),
+           (columns[:, None] + offsets[..., 0]).ravel()] = piece + 1
+    lines = clear_full_rows(boards)
+    return Placements(piece, rotations, columns, tops - MIN_ROWS[piece, rotations], tops, lines, boards)
+
+
+# Layout of the feature vector: the heights of the columns, then these
+HOLES, BUMPINESS, WELLS, ROW_TRANSITIONS = range(4)
+FEATURE_NAMES = ("holes", "bumpiness", "wells", "row_transitions")
+
+
+def feature_names(columns: int = 10) -> Tuple[str, ...]:
+    return tuple(f"height_{column}" for column in range(columns)) + FEATURE_NAMES
+
+
+def column_holes(grids: np.ndarray, surfaces: np.ndarray) -> np.ndarray:
+    """
+    Returns the number of empty cells below the surface of every column.
+    """
+    rows = grids.shape[-2]
+    return (rows - surfaces) - np.count_nonzero(grids, axis=-2)
+
+
+def row_transitions(grids: np.ndarray) -> np.ndarray:
+    """
+    Returns the number of changes between occupied and empty cells
+    along every row, the walls counting as occupied.
+    """
+    occupied = grids != EMPTY
+    transitions = np.count_nonzero(occupied[..., 1:] != occupied[..., :-1], axis=-1)
+    return transitions + ~occupied[..., 0] + ~occupied[..., -1]
+
+
+def summarize_heights(heights: np.ndarray, rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the bumpiness and the wells of column heights.
+    """
+    bumpiness = np.abs(np.diff(heights, axis=-1)).sum(axis=-1)
+    wall = np.full(heights.shape[:-1] + (1,), rows, dtype=heights.dtype)
+    padded = np.concatenate((wall, heights, wall), axis=-1)
+    depths = np.minimum(padded[..., :-2], padded[..., 2:]) - heights
+    return bumpiness, np.maximum(depths, 0).sum(axis=-1)
+
+
+def board_features(grids: np.ndarray) -> np.ndarray:
+    """
+    Returns the feature vectors of one grid or a stack of grids,
+    e.g. the boards of all placements or of a Batch_Environment.
+    """
+    rows, columns = grids.shape[-2:]
+    surfaces = column_surfaces(grids)
+    heights = rows - surfaces
+    features = np.empty(grids.shape[:-2] + (columns + len(FEATURE_NAMES),), dtype=np.int64)
+    features[..., :columns] = heights
+    features[..., columns + HOLES] = column_holes(grids, surfaces).sum(axis=-1)
+    features[..., columns + BUMPINESS], features[..., columns + WELLS] = summarize_heights(heights, rows)
+    features[..., columns + ROW_TRANSITIONS] = row_transitions(grids).sum(axis=-1)
+    return features
+
+
+# Inputs
+#   0 - 63: place the current tetromino, rotation << 4 | column
+#  64 - 70: draw tetromino 0 - 6 on the spawn position
+#       71: draw the current tetromino on the spawn position and spawn the next one
+#       72: clear the playfield
+#  80 - 95: push up a garbage row with the hole in column 0 - 15
+INPUT_PLACE = 0
+INPUT_DRAW = 64
+INPUT_SPAWN = 71
+INPUT_CLEAR = 72
+INPUT_GARBAGE = 80
+
+
+def place_input(rotation: int, column: int) -> int:
+    return INPUT_PLACE + (rotation << 4 | column)
+
+
+def garbage_input(hole: int) -> int:
+    return INPUT_GARBAGE + hole
+
+
+class Board():
+    """
+    The playfield of absolon as a grid of uint8 cells.
+
+    fill holds the number of occupied cells of every row. Code which writes
+    into the grid directly has to call recount() afterwards.
+    If moves is a list, the row moves of line clears and garbage are appended
+    to it as ("clear", rows) and ("garbage", number of rows), for views.
+    features is the feature vector of the grid, see board_features(),
+    heights is a view of its heights.
+    """
+    def __init__(self, rows: int = 24, columns: int = 10) -> None:
+        self.rows = rows
+        self.columns = columns
+        self.grid = np.zeros((rows, columns), dtype=np.uint8)
+        self.fill = np.zeros(rows, dtype=np.int64)
+        self.moves: Optional[list] = None
+        self.features = np.zeros(columns + len(FEATURE_NAMES), dtype=np.int64)
+        self.heights = self.features[:columns]
+        self.holes = np.zeros(columns, dtype=np.int64)
+        self.transitions = np.zeros(rows, dtype=np.int64)
+        self.recount()
+    def __repr__(self):
+        return f"Board(rows={self.rows}, columns={self.columns})"
+    def __str__(self):
+        return "\n".join("".join(CELL_NAMES[cell] for cell in row) for row in self.grid)
+    def clear(self) -> None:
+        self.grid[:] = EMPTY
+        self.fill[:] = 0
+        self.features[:] = 0
+        self.holes[:] = 0
+        # the walls on both sides of an empty row
+        self.transitions[:] = 2
+        self.summarize()
+    def recount(self) -> None:
+        """
+        Recomputes the row counts and the features from the grid.
+        """
+        self.fill[:] = np.count_nonzero(self.grid, axis=1)
+        surfaces = column_surfaces(self.grid)
+        self.heights[:] = self.rows - surfaces
+        self.holes[:] = column_holes(self.grid, surfaces)
+        self.transitions[:] = row_transitions(self.grid)
+        self.summarize()
+    def attach(self, grid: np.ndarray, features: np.ndarray) -> None:
+        """
+        Moves the grid and the features into the given arrays, e.g. views of
+        an observation buffer, so every change is written straight into them.
+        """
+        grid[:] = self.grid
+        features[:] = self.features
+        self.grid = grid
+        self.features = features
+        self.heights = features[:self.columns]
+    def summarize(self) -> None:
+        """
+        Updates the features derived from the heights, holes and transitions.
+        """
+        # plain Python is faster than NumPy for a handful of columns
+        heights = self.heights.tolist()
+        walled = [self.rows] + heights + [self.rows]
+        bumpiness = sum(abs(left - right) for left, right in zip(heights, heights[1:]))
+        wells = sum(max(min(left, right) - height, 0) for left, height, right in zip(walled, heights, walled[2:]))
+        self.features[self.columns:] = (self.holes.sum(), bumpiness, wells, self.transitions.sum())
+    def is_empty(self, column: int, row: int) -> bool:
+        return self.grid[row, column] == EMPTY
+    def fits(self, piece: int, rotation: int, column: int, row: int) -> bool:
+        """
+        Checks if the tetromino with its origin on [row, column]
+        lies within the playfield and does not overlap occupied cells.
+        """
+        for d_column, d_row in ROTATIONS[piece][rotation].cells:
+            c = column + d_column
+            r = row + d_row
+            if not (0 <= c < self.columns and 0 <= r < self.rows):
+                return False
+            if self.grid[r, c] != EMPTY:
+                return False
+        return True
+    def lock(self, piece: int, rotation: int, column: int, row: int) -> Tuple[Tuple[int, int], ...]:
+        """
+        Writes the tetromino with its origin on [row, column] into the grid
+        and returns the (column, row) coordinates of the cells it occupies.
+        """
+        cells = tuple((column + d_column, row + d_row) for d_column, d_row in ROTATIONS[piece][rotation].cells)
+        grid = self.grid
+        heights, holes, transitions = self.heights, self.holes, self.transitions
+        last = self.columns - 1
+        for c, r in cells:
+            line = grid[r]
+            if not line[c]:
+                self.fill[r] += 1
+                surface = self.rows - int(heights[c])
+                if r > surface:
+                    # fills a hole
+                    holes[c] -= 1
+                else:
+                    # covers the cells between the old surface and the cell
+                    holes[c] += surface - r - 1
+                    heights[c] = self.rows - r
+                # each side turns a transition into none or none into one
+                transitions[r] += 2 - 2 * ((c == 0 or bool(line[c - 1])) + (c == last or bool(line[c + 1])))
+            line[c] = piece + 1
+        self.summarize()
+        return cells
+    def surface(self, column: int) -> int:
+        """
+        Returns the row of the topmost occupied cell of a column,
+        or the number of rows if the column is empty.
+        """
+        occupied = np.flatnonzero(self.grid[:, column])
+        return int(occupied[0]) if occupied.size else self.rows
+    def drop(self, piece: int, rotation: int, column: int) -> Optional[Tuple[int, int]]:
+        """
+        Drops a tetromino whose leftmost mino is in the given column
+        from above the playfield.
+
+        Returns the (column, row) of the tetromino's origin where it comes to rest
+        or None if the placement leaves the playfield.
+        """
+        shape = ROTATIONS[piece][rotation]
+        if not 0 <= column <= self.columns - shape.width:
+            return None
+        top_row = min(self.surface(column + k) - bottom for k, bottom in enumerate(shape.bottoms)) - 1
+        if top_row < 0:
+            return None
+        return column - shape.min_column, top_row - shape.min_row
+    def full_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.fill == self.columns)
+    def clear_lines(self) -> int:
+        """
+        Removes all full rows, moves the rows above them down
+        and returns the number of cleared lines.
+        The rows below the lowest full row stay where they are.
+        """
+        full = self.full_rows()
+        cleared = int(full.size)
+        if cleared:
+            bottom = int(full[-1]) + 1
+            for rows in (self.grid, self.fill, self.transitions):
+                remaining = np.delete(rows[:bottom], full, axis=0)
+                rows[cleared:bottom] = remaining
+                rows[:cleared] = 0
+            self.transitions[:cleared] = 2
+            # full rows have no holes, so every column drops by the cleared lines,
+            # except the columns whose topmost cell was in the top full row
+            exposed = np.flatnonzero(self.heights == self.rows - full[0])
+            self.heights -= cleared
+            for c in exposed:
+                occupied = np.flatnonzero(self.grid[:, c])
+                self.heights[c] = self.rows - occupied[0] if occupied.size else 0
+                self.holes[c] = self.heights[c] - occupied.size
+            self.summarize()
+            if self.moves is not None:
+                self.moves.append(("clear", tuple(full.tolist())))
+        return cleared
+    def add_garbage(self, holes) -> bool:
+        """
+        Pushes the stack up and fills the rows below it with garbage,
+        one row per hole column in holes, from the top down.
+        Returns False if occupied cells are pushed out of the playfield.
+        """
+        holes = [int(hole) for hole in holes]
+        number = len(holes)
+        if not number:
+            return True
+        fits = not self.fill[:number].any()
+        for rows in (self.grid, self.fill, self.transitions):
+            rows[:-number] = rows[number:]
+        self.grid[-number:] = GARBAGE
+        self.grid[np.arange(self.rows - number, self.rows), holes] = EMPTY
+        if fits:
+            self.fill[-number:] = self.columns - 1
+            # the hole makes two transitions with its neighbours or the wall
+            self.transitions[-number:] = 2
+            # garbage rows are pushed in below the stack, so the holes in them
+            # only add to the holes of the columns which were occupied already
+            empty = np.flatnonzero(self.heights == 0).tolist()
+            self.heights += number
+            self.holes += np.bincount(holes, minlength=self.columns)
+            for c in empty:
+                top = next((row for row, hole in enumerate(holes) if hole != c), number)
+                self.heights[c] = number - top
+                self.holes[c] = holes[top:].count(c)
+            self.summarize()
+        else:
+            # cells were pushed out of the playfield
+            self.recount()
+        if self.moves is not None:
+            self.moves.append(("garbage", number))
+        return fits
+    def placements(self, piece, distinct: bool = False) -> Placements:
+        """
+        Returns every placement of a tetromino which fits, see enumerate_placements.
+        """
+        return enumerate_placements(self, piece, distinct)
+    def place(self, piece: int, rotation: int, column: int) -> Optional[Placement]:
+        """
+        Drops and locks a tetromino and clears the completed lines.
+        Returns None and leaves the board untouched if the placement is impossible.
+        """
+        origin = self.drop(piece, rotation, column)
+        if origin is None:
+            return None
+        origin_column, origin_row = origin
+        self.lock(piece, rotation, origin_column, origin_row)
+        return Placement(piece, rotation, column, origin_row, self.clear_lines())
+
+
+class Engine():
+    """
+    A headless single-player game. It places the tetrominoes an unpacker
+    spawns on a board, following the absolute control scheme.
+    """
+    def __init__(self,
+                 unpacker,
+                 rows: int = 24,
+                 columns: int = 10,
+                 spawn_row: int = 3,
+                 spawn_column: int = 4,
+                 board: Optional[Board] = None) -> None:
+        self.unpacker = unpacker
+        self.board = Board(rows, columns) if board is None else board
+        self.spawn_row = spawn_row
+        self.spawn_column = spawn_column
+        self.lines = 0
+        self.pieces = 0
+        self.topped_out = False
+        self.piece = self.unpacker.spawn_next()
+    def step(self, rotation: int, column: int) -> Optional[Placement]:
+        """
+        Places the current tetromino and spawns the next one.
+        An impossible placement tops the game out.
+        """
+        if self.topped_out:
+            return None
+        placement = self.board.place(self.piece, rotation, column)
+        if placement is None:
+            logger.debug("Engine topped out after %d pieces", self.pieces)
+            self.topped_out = True
+            return None
+        self.pieces += 1
+        self.lines += placement.lines
+        self.piece = self.unpacker.spawn_next()
+        return placement
+    def draw(self, piece: int) -> Tuple[Tuple[int, int], ...]:
+        """
+        Writes a tetromino on its spawn position, regardless of what is there.
+        """
+        return self.board.lock(piece, 0, self.spawn_column, self.spawn_row + ROTATIONS[piece][0].spawn_offset)
+    def add_garbage(self, holes) -> None:
+        """
+        Pushes up garbage rows, see Board.add_garbage.
+        Pushing the stack out of the playfield tops the game out.
+        """
+        if not self.board.add_garbage(holes):
+            logger.debug("Engine topped out by garbage after %d pieces", self.pieces)
+            self.topped_out = True
+    def apply(self, code: int) -> Optional[Placement]:
+        """
+        Applies one input to the game.
+        """
+        if code < INPUT_DRAW:
+            return self.step(code >> 4, code & 0xf)
+        if code < INPUT_SPAWN:
+            self.draw(code - INPUT_DRAW)
+        elif code == INPUT_SPAWN:
+            self.draw(self.piece)
+            self.piece = self.unpacker.spawn_next()
+        elif code == INPUT_CLEAR:
+            self.board.clear()
+        elif INPUT_GARBAGE <= code < INPUT_GARBAGE + self.board.columns:
+            self.add_garbage([code - INPUT_GARBAGE])
+        else:
+            raise ValueError(f"Invalid input {code}")
+        return None
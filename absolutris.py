@@ -1,21 +1,33 @@
 import os
 import pygame
-import pygame.freetype
 import configparser
 import random
 import logging
-import logging.config
 import logging_conf
-import numpy as np
-from typing import Iterator
+import time
+from typing import Optional
 from pathlib import Path
 # own modules
-import tetrominoes
-import generator
+import absolon
+import old_tetrominoes as tetrominoes
+import old_generator as generator
+import replay
+import frame_profiler
+import asset_bundle
+import tilemap
+import hud
 
 # Setup logging
-logging.config.dictConfig(logging_conf.dict_config)
-logger = logging.getLogger(__name__)
+logging_conf.configure()
+# named after the module, also when it runs as the script "__main__"
+logger = logging.getLogger("absolutris")
+
+# Frames between redraws of the profiler overlay
+OVERLAY_INTERVAL = 25
+# Top left corner of the first HUD field and the number of next tetrominoes it shows
+HUD_POSITION = (40, 400)
+HUD_PREVIEW = 6
+
 
 def read_or_create_config_file(path_to_configfile: Path) -> configparser.ConfigParser:
     """
@@ -29,6 +41,7 @@ def read_or_create_config_file(path_to_configfile: Path) -> configparser.ConfigP
         config.set("Basics", "# Settings related to the playfield window")
         config.set("Basics", "columns", "10")
         config.set("Basics", "rows", "24")
+        config.set("Basics", "# Tiles are this fraction of the vertical display resolution high and wide")
         config.set("Basics", "fraction_of_vres", "30")
         config.set("Basics", "x_position", "26")
         config.set("Basics", "y_position", "3")
@@ -51,14 +64,42 @@ def read_or_create_config_file(path_to_configfile: Path) -> configparser.ConfigP
         config.add_section("Technical")
         config.set("Technical", "# Framerate Limit")
         config.set("Technical", "framerate", "100")
+        config.set("Technical", "# Most rects to update per frame before updating their bounding rect, 0 for no limit")
+        config.set("Technical", "rect_budget", "32")
         config.add_section("Graphics")
         config.set("Graphics", "folder", "img")
         config.set("Graphics", "empty_playfield_tile", "opaque_playfield_tile.png")
+        config.set("Graphics", "tetromino_pattern", "pattern.png")
+        config.set("Graphics", "# Folder to keep the asset bundle (tile, colorized tetrominoes and font glyphs) in, leave empty to load the loose files")
+        config.set("Graphics", "sprite_cache", "cache")
         config.add_section("Colors")
         config.set("Colors", "# Color values need to be separated by comma and space \", \"")
         config.set("Colors", "game_window_background_color", "18, 18, 18, 255")
         config.set("Colors", "game_window_foreground_color", "245, 245, 245, 255")
         config.set("Colors", "font_color", "70, 70, 70, 255")
+        config.add_section("Generator")
+        config.set("Generator", "# Names from generator.packer_dict and generator.rs_factories")
+        config.set("Generator", "packer", "no_rules")
+        config.set("Generator", "random_source", "randint06")
+        config.set("Generator", "seed", "9001")
+        config.add_section("Replays")
+        config.set("Replays", "# Record every game into this folder")
+        config.set("Replays", "record", "yes")
+        config.set("Replays", "folder", "replays")
+        config.set("Replays", "# Write a keyframe for seeking every n inputs, 0 to record inputs only")
+        config.set("Replays", "keyframe_interval", "256")
+        config.add_section("Logging")
+        config.set("Logging", "# Log levels of the subsystems: DEBUG, INFO, WARNING, ERROR")
+        config.set("Logging", "engine", "WARNING")
+        config.set("Logging", "generator", "WARNING")
+        config.set("Logging", "renderer", "INFO")
+        config.set("Logging", "# Write the log from a background thread")
+        config.set("Logging", "queue", "yes")
+        config.add_section("Profiling")
+        config.set("Profiling", "# Show the percentiles of the frame phase times on screen")
+        config.set("Profiling", "overlay", "no")
+        config.set("Profiling", "# Write histograms of the frame phase times into this file on exit, leave empty to disable")
+        config.set("Profiling", "histogram_file", "frame_times.json")
         with open(path_to_configfile, mode="w", encoding="utf-8") as configfh:
             config.write(configfh)
     config.read(path_to_configfile)
@@ -74,14 +115,39 @@ def debug_delete_config(path_to_configfile: Path) -> None:
         path_to_configfile.unlink()
 
 
+def merge_runs(rects: list, position: int) -> list:
+    """
+    Merges rects which share the same band and overlap or touch along it.
+    position 0 merges horizontally within rows of equal (y, h),
+    position 1 merges vertically within columns of equal (x, w).
+    Rects are (x, y, w, h) tuples. The merged area equals the area of the rects.
+    """
+    start, length = position, position + 2
+    band = 1 - position
+    merged = []
+    for rect in sorted(rects, key=lambda r: (r[band], r[band + 2], r[start])):
+        if merged:
+            last = merged[-1]
+            if (last[band], last[band + 2]) == (rect[band], rect[band + 2]) and rect[start] <= last[start] + last[length]:
+                end = max(last[start] + last[length], rect[start] + rect[length])
+                grown = list(last)
+                grown[length] = end - last[start]
+                merged[-1] = tuple(grown)
+                continue
+        merged.append(rect)
+    return merged
+
+
 class Rectlist(list):
     """
     A variant of a list which keeps memory of its highest member count.
-    It also keeps track of how many items have been added since last reset.
+    It also keeps track of how many items have been added since last reset
+    and how many rects they were coalesced into.
     """
     def __init__(self):
         self.max_items = 0
         self.added_items = 0
+        self.coalesced_items = 0
         super().__init__()
     def update_max(self):
         if self.max_items < len(self):
@@ -94,78 +160,94 @@ class Rectlist(list):
         self.extend(itr)
         self.added_items = self.added_items + len(itr)
         self.update_max()
+    def coalesce(self, budget: int = 0) -> list:
+        """
+        Returns the damaged area as few rects as possible:
+        duplicates and rects covered by other rects are dropped,
+        neighbouring rects of a row or column are merged into one.
+        If more rects than the budget remain, their bounding rect is returned instead.
+        A budget of 0 means no budget.
+        """
+        rects = set(tuple(rect) for rect in self)
+        if len(rects) > 1:
+            rects = merge_runs(merge_runs(list(rects), 0), 1)
+            rects = [pygame.Rect(rect) for rect in rects]
+            rects = [rect for index, rect in enumerate(rects)
+                     if not any(other.contains(rect) for other_index, other in enumerate(rects) if other_index != index)]
+            if budget and len(rects) > budget:
+                rects = [rects[0].unionall(rects[1:])]
+        else:
+            rects = [pygame.Rect(rect) for rect in rects]
+        self.coalesced_items = self.coalesced_items + len(rects)
+        return rects
     def reset_max(self):
         self.max_items = 0
     def reset_added(self):
         self.added_items = 0
+        self.coalesced_items = 0
     def reset(self):
         self.reset_max()
         self.reset_added()
 
 
-class Tile():
-    def __init__(self, surface: pygame.Surface) -> None:
-        """
-        Creates a Tile which is a direct subsurface of the game window.
-        """
-        self.surface = surface
-        self.hold = []
-    def is_empty(self) -> bool:
-        return not bool(self.hold[1:])
-    def get_rect(self) -> pygame.Rect:
-        return self.surface.get_rect().move(self.surface.get_abs_offset())
-
-
 class Playfield():
+    """
+    The view of an absolon.Board, drawn by a tilemap.Tile_Map.
+    """
     def __init__(self, 
-                 rows: int, 
-                 columns: int, 
-                 sequence: Iterator[Tile], 
-                 img: pygame.Surface, 
-                 rects_to_update: list, 
+                 tile_map: tilemap.Tile_Map, 
                  spawn_row: int,
-                 spawn_column: int) -> None:
-        self.empty_tile_img = img
-        self.tile_array = np.asarray(list(sequence), dtype=object).reshape(rows, columns)
-        self.rects_to_update = rects_to_update
-        self.blit_initial_images(img)
+                 spawn_column: int,
+                 board: Optional[absolon.Board] = None) -> None:
+        self.tile_map = tile_map
+        rows, columns = tile_map.shown.shape
+        self.board = absolon.Board(rows, columns) if board is None else board
+        # let the board log its row moves, to scroll them
+        self.board.moves = []
         self.spawn_column = spawn_column
         self.spawn_row = spawn_row
-    def blit_initial_images(self, img) -> None:
-        rows, columns = self.tile_array.shape
-        for row in range(rows):
-            for column in range(columns):
-                self.blyt(column, row, img)
-    def blyt(self, column: int, row: int, srf: pygame.Surface) -> None:
+        self.sync()
+    def follow_moves(self) -> None:
         """
-        Custom version of pygame.Surface.blit. I called it blyt to be aware of its distinction.
-        It blits an image (srf) on the tile under [row, column], puts the image into this tile's hold,
-        and adds the rectangle of the blitting into the list of the rectangles to update.
+        Scrolls the images of the rows the board has moved since the last sync.
         """
-        hold = self.tile_array[row, column].hold
-        tile_surf = self.tile_array[row, column].surface
-        rect = tile_surf.blit(srf, (0, 0))
-        self.rects_to_update.appendr(rect.move(tile_surf.get_abs_offset()))
-        hold.append(srf)
+        tile_map = self.tile_map
+        rows = tile_map.shown.shape[0]
+        for kind, argument in self.board.moves:
+            if kind == "clear":
+                # bottom up, the rows between two cleared rows move down by the number of cleared rows below them
+                cleared = argument
+                for shift, row in enumerate(reversed(cleared), start=1):
+                    top = cleared[-shift - 1] + 1 if shift < len(cleared) else tile_map.first_shown_row()
+                    if top < row:
+                        tile_map.scroll(top, row + shift, shift)
+            elif kind == "garbage":
+                tile_map.scroll(max(tile_map.first_shown_row() - argument, 0), rows, -argument)
+        self.board.moves.clear()
+    def sync(self) -> None:
+        """
+        Draws every cell of the board which differs from what its tile shows.
+        """
+        if self.board.moves:
+            self.follow_moves()
+        self.tile_map.draw(self.board.grid)
     def clear_all_tiles(self) -> None:
-        # find all tiles which hold something, for debugging
-        rows, columns = self.tile_array.shape
-        for row in range(rows):
-            for column in range(columns):
-                if not self.tile_array[row, column].is_empty():
-                    self.tile_array[row, column].hold = []
-                    self.blyt(column, row, self.empty_tile_img)
+        # empty the board, for debugging
+        self.board.clear()
+        self.sync()
     def draw_tetromino(self, tetromino):
         """
         This will render a tetrominoes current rotated shape
         in the playfield.
 
-        It takes the relative coordinate pairs the current shape delivers
-        and blits the tetromino's image into the corresponding playfield's
-        coordinates
+        It writes the tetromino into the board on its spawn position
+        and blits the tetromino's image into the cells it occupies.
         """
-        for mino in tetromino:
-            self.blyt(self.spawn_column + mino.column, self.spawn_row + mino.row + tetromino.spawn_offset, tetromino.img)
+        self.board.lock(tetromino.piece,
+                        tetromino.current_rotation,
+                        self.spawn_column,
+                        self.spawn_row + tetromino.spawn_offset)
+        self.sync()
 
 
 class Game():
@@ -197,19 +279,26 @@ class Game():
         self.game_window_width = self.config.getint("Game_window", "width")
         self.game_window_height = self.config.getint("Game_window", "height")
         self.framerate = self.config.getint("Technical", "framerate")
+        self.rect_budget = self.config.getint("Technical", "rect_budget")
         self.graphics_folder = Path(self.config.get("Graphics", "folder"))
         self.playfield_tile_file = self.graphics_folder / Path(self.config.get("Graphics", "empty_playfield_tile"))
+        self.tetromino_pattern_file = self.graphics_folder / Path(self.config.get("Graphics", "tetromino_pattern"))
+        sprite_cache = self.config.get("Graphics", "sprite_cache")
+        self.sprite_cache_folder = Path(sprite_cache) if sprite_cache else None
         self.game_window_background_color = self.config.getcolor("Colors", "game_window_background_color")
         self.game_window_foreground_color = self.config.getcolor("Colors", "game_window_foreground_color")
         self.font_color = self.config.getcolor("Colors", "font_color")
-    def create_playfield_tiles(self) -> Iterator[Tile]:
-        for y in range(self.playfield_rows):
-            for x in range(self.playfield_columns):
-                rect = pygame.Rect(x * self.playfield_tile_img.get_width() + self.playfield_x_position * self.playfield_fraction_of_vres, 
-                                   y * self.playfield_tile_img.get_height() + self.playfield_y_position * self.playfield_fraction_of_vres, 
-                                   self.playfield_tile_img.get_width(), 
-                                   self.playfield_tile_img.get_height())
-                yield Tile(self.game_window.subsurface(rect))
+        self.packer_name = self.config.get("Generator", "packer")
+        self.rs_name = self.config.get("Generator", "random_source")
+        self.seed = self.config.getint("Generator", "seed")
+        self.record_replays = self.config.getboolean("Replays", "record")
+        self.replay_folder = Path(self.config.get("Replays", "folder"))
+        self.keyframe_interval = self.config.getint("Replays", "keyframe_interval")
+        self.log_levels = {subsystem: self.config.get("Logging", subsystem) for subsystem in logging_conf.subsystem_loggers}
+        self.log_queue = self.config.getboolean("Logging", "queue")
+        self.profiler_overlay = self.config.getboolean("Profiling", "overlay")
+        histogram_file = self.config.get("Profiling", "histogram_file")
+        self.histogram_file = Path(histogram_file) if histogram_file else None
     def setup_game_window(self) -> None:
         pygame.display.set_caption(self.window_title)
         self.game_window = pygame.display.set_mode(
@@ -220,45 +309,187 @@ class Game():
                 pygame.NOFRAME
             )
         self.game_window.fill((self.game_window_background_color))
-        # load tile image
-        self.playfield_tile_img = pygame.image.load(str(self.playfield_tile_file))
-        # Create tiles of the playfield and blit their empty tile images
-        self.pf = Playfield(self.playfield_rows, 
-                            self.playfield_columns, 
-                            self.create_playfield_tiles(), 
-                            self.playfield_tile_img, 
-                            self.list_of_rectangles_to_update,
+        self.font_size = int(self.current_display_vres / self.font_size_fraction_of_vres)
+        self.tile_size = tilemap.tile_size(self.current_display_vres, self.playfield_fraction_of_vres)
+        if self.sprite_cache_folder is not None:
+            # tile, tetromino images and font glyphs from the bundle, converted to the display format
+            self.assets = asset_bundle.load_bundle(self.sprite_cache_folder,
+                                                   self.playfield_tile_file,
+                                                   self.tetromino_pattern_file,
+                                                   tetrominoes.COLOR_DICT,
+                                                   self.font_file,
+                                                   self.font_size)
+            self.playfield_tile_img = self.assets.surface("tile")
+            tetrominoes.sprite_atlas = self.assets.sprite_atlas()
+            self.game_font = self.assets.glyph_font()
+        else:
+            self.assets = None
+            self.playfield_tile_img = pygame.image.load(str(self.playfield_tile_file)).convert_alpha()
+            # colorize the tetromino images once for all tetrominoes
+            tetrominoes.load_sprite_atlas(self.tetromino_pattern_file)
+            self.game_font = self.load_font()
+        # all cell images in one atlas, scaled to the tile size of this resolution
+        self.tile_atlas = tilemap.Tile_Atlas(tilemap.cell_images(self.playfield_tile_img, tetrominoes.sprite_atlas),
+                                             self.game_window_background_color)
+        tile_map = tilemap.Tile_Map(self.game_window,
+                                    (self.playfield_x_position * self.playfield_fraction_of_vres,
+                                     self.playfield_y_position * self.playfield_fraction_of_vres),
+                                    self.tile_atlas.at(self.tile_size),
+                                    self.playfield_rows,
+                                    self.playfield_columns,
+                                    self.list_of_rectangles_to_update)
+        self.pf = Playfield(tile_map,
                             self.playfield_spawn_row,
                             self.playfield_spawn_column,
                             )
-    def run_game(self) -> None:
+        self.setup_hud()
+    def load_font(self) -> asset_bundle.Glyph_Font:
+        # only needed without an asset bundle
+        return asset_bundle.load_glyph_font(self.font_file, self.font_size)
+    def setup_hud(self) -> None:
+        self.hud = hud.Hud(self.game_window,
+                           self.game_font,
+                           self.font_color,
+                           self.game_window_background_color,
+                           self.list_of_rectangles_to_update)
+        x, y = HUD_POSITION
+        for i, (name, template) in enumerate((("lines", "lines {}"), ("pieces", "pieces {}"), ("next", "next {}"))):
+            self.hud.add_field(name, (x, y + i * self.font_size * 3 // 2), template)
+    def update_hud(self) -> None:
+        """
+        Redraws the HUD fields whose values changed.
+        """
+        engine = self.engine
+        self.hud.update(lines=engine.lines,
+                        pieces=engine.pieces,
+                        next="".join(absolon.PIECE_NAMES[piece] for piece in engine.unpacker.peek(HUD_PREVIEW)))
+    def setup_logging(self) -> None:
+        logging_conf.set_subsystem_levels(self.log_levels)
+        if self.log_queue:
+            logging_conf.start_queue_listener()
+    def setup(self) -> None:
+        self.setup_logging()
         # Set initial game window position
         os.environ["SDL_VIDEO_WINDOW_POS"] = f"{self.initial_horizontal_window_position},{self.initial_vertical_window_position}"
         pygame.init()
         # Get monitor's resolution
         self.current_display_vres = pygame.display.Info().current_h
         self.current_display_hres = pygame.display.Info().current_w
-        self.playfield_x_dim = self.current_display_vres / self.playfield_fraction_of_vres * self.playfield_columns
-        self.playfield_y_dim = self.current_display_vres / self.playfield_fraction_of_vres * self.playfield_rows
         # Prepare list of rectangles to update
         self.list_of_rectangles_to_update = Rectlist()
-        # Find out how to scale the game window
-        logger.warning("Need to find out how to scale the game window.")
+        # The tiles are scaled to a fraction of the vertical resolution, see setup_game_window
         self.setup_game_window()
         pygame.display.flip()
-        # Setup font
-        self.font_size = int(self.current_display_vres / self.font_size_fraction_of_vres)
-        self.game_font = pygame.freetype.Font(
-                str(self.font_file), 
-                self.font_size
-            )
         # Setup game clock
         self.clock = pygame.time.Clock()
+        self.profiler = frame_profiler.Frame_Profiler(budget=1 / self.framerate if self.framerate else 0.0)
+        self.overlay_rect = pygame.Rect(10, 10, 0, 0)
         # Setup events
         self.TICK = pygame.USEREVENT + 0
         self.DROPSTEP = pygame.USEREVENT + 1
         # Generate a TICK event every 1000 milliseconds
         pygame.time.set_timer(self.TICK, 1000)
+        # Keys and the inputs they give to the engine
+        self.input_keys = {pygame.K_KP1: absolon.INPUT_DRAW + absolon.I,
+                           pygame.K_KP2: absolon.INPUT_DRAW + absolon.J,
+                           pygame.K_KP3: absolon.INPUT_DRAW + absolon.L,
+                           pygame.K_KP4: absolon.INPUT_DRAW + absolon.O,
+                           pygame.K_KP5: absolon.INPUT_DRAW + absolon.S,
+                           pygame.K_KP6: absolon.INPUT_DRAW + absolon.T,
+                           pygame.K_KP7: absolon.INPUT_DRAW + absolon.Z,
+                           # Spawn new random tetromino when N is pressed
+                           pygame.K_n: absolon.INPUT_SPAWN,
+                           pygame.K_q: absolon.INPUT_CLEAR,
+                           }
+    def setup_engine(self) -> None:
+        # DEBUG: Before levels are implemented, we need at least an unpacker
+        self.unpacker = generator.new_unpacker(self.packer_name, self.rs_name, self.seed)
+        self.engine = absolon.Engine(self.unpacker,
+                                     self.playfield_rows,
+                                     self.playfield_columns,
+                                     self.playfield_spawn_row,
+                                     self.playfield_spawn_column,
+                                     self.pf.board)
+        self.recorder = None
+        if self.record_replays:
+            header = replay.Replay_Header(replay.RULESET, self.packer_name, self.rs_name, self.seed,
+                                          self.playfield_rows, self.playfield_columns,
+                                          self.playfield_spawn_row, self.playfield_spawn_column)
+            path = self.replay_folder / (time.strftime("%Y%m%dT%H%M%S") + replay.SUFFIX)
+            self.recorder = replay.Recorder(path, header, self.engine, self.keyframe_interval)
+    def give_input(self, code: int) -> None:
+        """
+        Applies an input to the engine, records it and shows the result.
+        """
+        self.profiler.lap("input")
+        self.engine.apply(code)
+        if self.recorder is not None:
+            self.recorder.record(self.frame, code)
+        self.profiler.lap("simulation")
+        self.pf.sync()
+        self.profiler.lap("blit")
+    def draw_profiler_overlay(self) -> None:
+        """
+        Shows the frame phase percentiles in the top left corner.
+        """
+        self.game_window.fill(self.game_window_background_color, self.overlay_rect)
+        self.list_of_rectangles_to_update.appendr(self.overlay_rect.copy())
+        x, y = self.overlay_rect.topleft
+        rects = []
+        for i, line in enumerate(self.profiler.overlay_lines()):
+            rects.append(self.game_font.render_to(self.game_window, (x, y + i * self.font_size * 3 // 2), line,
+                                                  fgcolor=self.game_window_foreground_color))
+        self.overlay_rect = self.overlay_rect.unionall(rects)
+        self.list_of_rectangles_to_update.appendr(self.overlay_rect.copy())
+    def quit(self) -> None:
+        logger.info("Quitting game")
+        if self.histogram_file is not None:
+            self.profiler.export(self.histogram_file)
+        pygame.quit()
+        logging_conf.stop_queue_listener()
+    def run_frame(self) -> None:
+        """
+        One pass of the main game loop.
+        """
+        profiler = self.profiler
+        pygame.display.update(self.list_of_rectangles_to_update.coalesce(self.rect_budget))
+        # Clear the list in place, because it is shared among instances of classes
+        self.list_of_rectangles_to_update.clear()
+        profiler.lap("update")
+        self.clock.tick(self.framerate)
+        profiler.lap("tick")
+        self.frame += 1
+        events = pygame.event.get()
+        profiler.lap("events")
+        for event in events:
+            # When user closes window with the mouse
+            if event.type == pygame.QUIT:
+                self.pygame_running = False
+                break
+            # Close main window if Ctrl+Q is pressed
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_q:
+                    mods = pygame.key.get_mods()
+                    if mods & pygame.KMOD_CTRL:
+                        self.pygame_running = False
+                        break
+                    logger.debug("Clearing all tiles")
+                if event.key in self.input_keys:
+                    self.give_input(self.input_keys[event.key])
+            if event.type == self.TICK:
+                logger.debug("TICK with %d rects to redraw, coalesced into %d",
+                             self.list_of_rectangles_to_update.added_items,
+                             self.list_of_rectangles_to_update.coalesced_items)
+                self.list_of_rectangles_to_update.reset()
+        profiler.lap("input")
+        self.update_hud()
+        profiler.lap("blit")
+        if self.profiler_overlay and self.frame % OVERLAY_INTERVAL == 0:
+            self.draw_profiler_overlay()
+            profiler.lap("blit")
+        profiler.end_frame()
+    def run_game(self) -> None:
+        self.setup()
         # Start the game
         self.pygame_running = True
         logger.info("Starting game")
@@ -267,57 +498,19 @@ class Game():
         logger.debug("Moving it into position")
         text_rect = pygame.Rect(40, 350, text_rect.w, text_rect.h)
         self.list_of_rectangles_to_update.appendr(text_rect)
-        # DEBUG: Before levels are implemented, we need at least an unpacker
-        self.unpacker = generator.Unpacker(generator.packer_dict["no_rules"], generator.rs_dict["randint06"])
+        self.setup_engine()
+        self.frame = 0
+        self.profiler.start()
         # Main game loop
         while self.pygame_running:
-            pygame.display.update(self.list_of_rectangles_to_update)
-            # Need to clear the list carefully, because it is shared among instances of classes
-            for _ in range(len(self.list_of_rectangles_to_update)):
-                del self.list_of_rectangles_to_update[0]
-            self.clock.tick(self.framerate)
-            for event in pygame.event.get():
-                # When user closes window with the mouse
-                if event.type == pygame.QUIT:
-                    self.pygame_running = False
-                    break
-                # Close main window if Ctrl+Q is pressed
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_q:
-                        mods = pygame.key.get_mods()
-                        if mods & pygame.KMOD_CTRL:
-                            self.pygame_running = False
-                            break
-                        logger.debug("Clearing all tiles")
-                        self.pf.clear_all_tiles()
-                    if event.key == pygame.K_KP1:
-                        self.pf.draw_tetromino(tetrominoes.Tetromino_I())
-                    if event.key == pygame.K_KP2:
-                        self.pf.draw_tetromino(tetrominoes.Tetromino_J())
-                    if event.key == pygame.K_KP3:
-                        self.pf.draw_tetromino(tetrominoes.Tetromino_L())
-                    if event.key == pygame.K_KP4:
-                        self.pf.draw_tetromino(tetrominoes.Tetromino_O())
-                    if event.key == pygame.K_KP5:
-                        self.pf.draw_tetromino(tetrominoes.Tetromino_S())
-                    if event.key == pygame.K_KP6:
-                        self.pf.draw_tetromino(tetrominoes.Tetromino_T())
-                    if event.key == pygame.K_KP7:
-                        self.pf.draw_tetromino(tetrominoes.Tetromino_Z())
-                    # Spawn new random tetromino when N is pressed
-                    if event.key == pygame.K_n:
-                        random_number = self.unpacker.spawn_next()
-                        self.pf.draw_tetromino(tetrominoes.mapping[random_number]())
-                if event.type == self.TICK:
-                    logger.debug(f"TICK with {self.list_of_rectangles_to_update.added_items} rects to redraw")
-                    self.list_of_rectangles_to_update.reset()
-        logger.info("Quitting game")
-        pygame.quit()
+            self.run_frame()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.quit()
 
 
 if __name__ == "__main__":
     configfilepath = Path("config.ini")
-    debug_delete_config(configfilepath)
     game = Game(configfilepath)
     try:
         game.run_game()
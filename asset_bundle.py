@@ -0,0 +1,280 @@
+# This module packs the images of absolutris into one asset bundle.
+#
+# Starting the game used to mean decoding the PNG of the empty playfield
+# tile, colorizing the tetromino pattern and rasterizing the font. The
+# bundle holds the results of all of that as raw RGBA pixels:
+#
+#   tile            the empty playfield tile
+#   sprite/<color>  the pattern colorized for every color of COLOR_DICT
+#   glyph/<char>    the printable ASCII characters rasterized in white
+#                   at the font size of the current resolution
+#
+# Layout of a bundle file:
+#
+#   magic "ABSB", version           5 bytes
+#   length of the index             4 bytes, little endian
+#   index                           JSON: name -> offset, width, height,
+#                                   and the metrics of the glyphs
+#   pixels                          starting at a multiple of 16
+#
+# The file is memory-mapped and the pixels are read as NumPy views, so
+# loading does not decode or copy anything until the surfaces are
+# converted to the pixel format of the display, once per start.
+#
+# The name of a bundle file contains a hash of the source files, the
+# color table and the font size. A bundle is built when there is none
+# for the current sources, so a change of an image or of the resolution
+# rebuilds it. pygame.freetype is only imported for rasterizing, when a
+# bundle is built or the game runs without one.
+
+import hashlib
+import json
+import mmap
+import struct
+import logging
+import logging_conf
+import numpy as np
+import pygame
+from pathlib import Path
+from typing import Dict, Tuple
+# own modules
+import old_tetrominoes as tetrominoes
+
+
+# Setup logging
+logging_conf.configure()
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b"ABSB"
+VERSION = 1
+PREFIX_STRUCT = struct.Struct("<4sBI")
+ALIGNMENT = 16
+SUFFIX = ".absb"
+GLYPHS = "".join(chr(code) for code in range(32, 127))
+
+
+def bundle_key(tile_file: Path,
+               pattern_file: Path,
+               color_dict: Dict[str, tetrominoes.Colorization],
+               font_file: Path,
+               font_size: int) -> str:
+    digest = hashlib.sha256(bytes([VERSION]))
+    for source in (tile_file, pattern_file, font_file):
+        digest.update(Path(source).read_bytes())
+    digest.update(repr((sorted(color_dict.items()), font_size, GLYPHS)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def image_array(image_file: Path) -> np.ndarray:
+    """
+    Decodes an image file into a (height, width, 4) RGBA array.
+    """
+    image = pygame.image.load(str(image_file))
+    width, height = image.get_size()
+    return np.frombuffer(pygame.image.tobytes(image, "RGBA"), dtype=np.uint8).reshape(height, width, 4)
+
+
+def surface_array(surface: pygame.Surface) -> np.ndarray:
+    width, height = surface.get_size()
+    return np.frombuffer(pygame.image.tobytes(surface, "RGBA"), dtype=np.uint8).reshape(height, width, 4)
+
+
+def rasterize_glyphs(font_file: Path, font_size: int) -> Tuple[Dict[str, np.ndarray], Dict[str, Tuple[int, int, float]]]:
+    """
+    Rasterizes the GLYPHS in white and returns their pixels and their
+    (bearing_x, bearing_y, advance) metrics.
+    """
+    import pygame.freetype
+    if not pygame.freetype.get_init():
+        pygame.freetype.init()
+    font = pygame.freetype.Font(str(font_file), font_size)
+    arrays = {}
+    metrics = {}
+    for char in GLYPHS:
+        surface, rect = font.render(char, fgcolor=(255, 255, 255, 255))
+        arrays[char] = surface_array(surface)
+        metrics[char] = (rect.x, rect.y, font.get_metrics(char)[0][4])
+    return arrays, metrics
+
+
+def build_bundle(path: Path,
+                 tile_file: Path,
+                 pattern_file: Path,
+                 color_dict: Dict[str, tetrominoes.Colorization],
+                 font_file: Path,
+                 font_size: int) -> None:
+    """
+    Decodes, colorizes and rasterizes the sources and writes the bundle file.
+    """
+    logger.info("Building the asset bundle %s", path)
+    images = {"tile": image_array(tile_file)}
+    pattern = image_array(pattern_file)
+    for color, colorization in color_dict.items():
+        images[f"sprite/{color}"] = tetrominoes.colorize_array(pattern, colorization)
+    arrays, glyphs = rasterize_glyphs(font_file, font_size)
+    for char, rgba in arrays.items():
+        images[f"glyph/{char}"] = rgba
+    entries = {}
+    offset = 0
+    for name, rgba in images.items():
+        height, width, _ = rgba.shape
+        entries[name] = (offset, width, height)
+        offset += -(-rgba.nbytes // ALIGNMENT) * ALIGNMENT
+    index = json.dumps({"entries": entries, "glyphs": glyphs, "font_size": font_size}).encode("utf-8")
+    start = -(-(PREFIX_STRUCT.size + len(index)) // ALIGNMENT) * ALIGNMENT
+    pixels = bytearray(offset)
+    for name, rgba in images.items():
+        entry_offset = entries[name][0]
+        pixels[entry_offset:entry_offset + rgba.nbytes] = rgba.tobytes()
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_suffix(".tmp")
+    with open(temporary, mode="wb") as bundle_file:
+        bundle_file.write(PREFIX_STRUCT.pack(MAGIC, VERSION, len(index)) + index)
+        bundle_file.write(bytes(start - PREFIX_STRUCT.size - len(index)))
+        bundle_file.write(pixels)
+    # a bundle is either complete or absent, even if the game is killed while writing it
+    temporary.replace(path)
+
+
+def to_surface(rgba: np.ndarray) -> pygame.Surface:
+    """
+    Turns a (height, width, 4) array into a surface, converted
+    to the pixel format of the display if there is one.
+    """
+    height, width, _ = rgba.shape
+    if not rgba.size:
+        # e.g. the glyph of the space
+        return pygame.Surface((width, height), pygame.SRCALPHA)
+    surface = pygame.image.frombuffer(rgba, (width, height), "RGBA")
+    if pygame.display.get_surface() is not None:
+        return surface.convert_alpha()
+    return surface.copy()
+
+
+class Asset_Bundle():
+    """
+    A memory-mapped asset bundle file.
+    """
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        with open(self.path, mode="rb") as bundle_file:
+            self.data = mmap.mmap(bundle_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, length = PREFIX_STRUCT.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path} is not an asset bundle of version {VERSION}")
+        index = json.loads(self.data[PREFIX_STRUCT.size:PREFIX_STRUCT.size + length])
+        self.entries: Dict[str, Tuple[int, int, int]] = index["entries"]
+        self.glyphs: Dict[str, Tuple[int, int, float]] = index["glyphs"]
+        self.font_size = index["font_size"]
+        self.start = -(-(PREFIX_STRUCT.size + length) // ALIGNMENT) * ALIGNMENT
+    def array(self, name: str) -> np.ndarray:
+        """
+        Returns the pixels of an image as a read-only view of the file.
+        """
+        offset, width, height = self.entries[name]
+        return np.frombuffer(self.data, dtype=np.uint8, count=width * height * 4,
+                             offset=self.start + offset).reshape(height, width, 4)
+    def surface(self, name: str) -> pygame.Surface:
+        return to_surface(self.array(name))
+    def sprite_atlas(self) -> tetrominoes.Sprite_Atlas:
+        arrays = {name[len("sprite/"):]: self.array(name) for name in self.entries if name.startswith("sprite/")}
+        return tetrominoes.Sprite_Atlas(arrays=arrays)
+    def glyph_font(self) -> "Glyph_Font":
+        surfaces = {char: self.surface(f"glyph/{char}") for char in self.glyphs}
+        return Glyph_Font(surfaces, self.glyphs)
+
+
+class Glyph_Font():
+    """
+    Renders text from pre-rasterized glyphs, with the render_to
+    of pygame.freetype.Font for the text absolutris draws.
+    The glyphs are packed side by side into one atlas surface,
+    which is tinted once per color.
+    """
+    def __init__(self, surfaces: Dict[str, pygame.Surface], metrics: Dict[str, Tuple[int, int, float]]) -> None:
+        self.metrics = metrics
+        self.sizes = {char: surface.get_size() for char, surface in surfaces.items()}
+        width = sum(size[0] for size in self.sizes.values())
+        height = max((size[1] for size in self.sizes.values()), default=0)
+        self.atlas = pygame.Surface((max(width, 1), max(height, 1)), pygame.SRCALPHA)
+        self.areas: Dict[str, pygame.Rect] = {}
+        x = 0
+        for char, surface in surfaces.items():
+            # copy the pixels with their alpha instead of blending them onto the transparent atlas
+            self.atlas.blit(surface, (x, 0), special_flags=pygame.BLEND_RGBA_MAX)
+            self.areas[char] = pygame.Rect((x, 0), self.sizes[char])
+            x += self.sizes[char][0]
+        if pygame.display.get_surface() is not None:
+            self.atlas = self.atlas.convert_alpha()
+        self.tinted: Dict[Tuple, pygame.Surface] = {}
+    def glyphs(self, color) -> pygame.Surface:
+        """
+        Returns the atlas tinted in color.
+        """
+        key = tuple(pygame.Color(color))
+        atlas = self.tinted.get(key)
+        if atlas is None:
+            atlas = self.atlas.copy()
+            atlas.fill(key, special_flags=pygame.BLEND_RGBA_MULT)
+            self.tinted[key] = atlas
+        return atlas
+    def get_rect(self, text: str) -> pygame.Rect:
+        """
+        Returns the size of the rendered text.
+        """
+        chars = [char for char in text if char in self.metrics]
+        if not chars:
+            return pygame.Rect(0, 0, 0, 0)
+        top = max(self.metrics[char][1] for char in chars)
+        bottom = min(self.metrics[char][1] - self.sizes[char][1] for char in chars)
+        # from the first to the last pixel of the glyphs, like pygame.freetype
+        first, last = chars[0], chars[-1]
+        width = (round(sum(self.metrics[char][2] for char in chars[:-1])) + self.metrics[last][0] + self.sizes[last][0]
+                 - self.metrics[first][0])
+        return pygame.Rect(0, 0, width, top - bottom)
+    def render_to(self, surface: pygame.Surface, dest, text: str, fgcolor=(255, 255, 255, 255)) -> pygame.Rect:
+        """
+        Blits the text with the top left corner of its bounding box on dest
+        and returns the rect it covers.
+        """
+        atlas = self.glyphs(fgcolor)
+        rect = self.get_rect(text).move(dest)
+        chars = [char for char in text if char in self.metrics]
+        if not chars:
+            return rect
+        top = rect.y + max(self.metrics[char][1] for char in chars)
+        # the first pixel of the first glyph is on dest
+        x = float(rect.x - self.metrics[chars[0]][0])
+        blits = []
+        for char in chars:
+            bearing_x, bearing_y, advance = self.metrics[char]
+            blits.append((atlas, (round(x) + bearing_x, top - bearing_y), self.areas[char]))
+            x += advance
+        surface.blits(blits, doreturn=False)
+        return rect
+
+
+def load_glyph_font(font_file: Path, font_size: int) -> Glyph_Font:
+    """
+    Rasterizes a Glyph_Font without a bundle.
+    """
+    arrays, metrics = rasterize_glyphs(font_file, font_size)
+    return Glyph_Font({char: to_surface(rgba) for char, rgba in arrays.items()}, metrics)
+
+
+def load_bundle(folder: Path,
+                tile_file: Path,
+                pattern_file: Path,
+                color_dict: Dict[str, tetrominoes.Colorization],
+                font_file: Path,
+                font_size: int) -> Asset_Bundle:
+    """
+    Opens the bundle of the given sources in folder, building it first if needed.
+    """
+    key = bundle_key(tile_file, pattern_file, color_dict, font_file, font_size)
+    path = Path(folder) / f"assets_{key}{SUFFIX}"
+    if not path.is_file():
+        build_bundle(path, tile_file, pattern_file, color_dict, font_file, font_size)
+    return Asset_Bundle(path)
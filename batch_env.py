@@ -0,0 +1,147 @@
+# This module steps many absolon games in lockstep.
+#
+# The boards of all games are held in one uint8 tensor of the shape
+# (games, rows, columns), encoded exactly like absolon.Board.grid.
+# An action is an absolute placement (rotation 0-3, column 0-9), the
+# column being the leftmost column the rotated tetromino occupies.
+# Drops, locks and line clears are applied to all boards at once with
+# vectorized NumPy operations.
+#
+# Every game draws its tetrominoes from its own seeded Block_Source, so
+# the games do not share random state. The packer packs BUFFERED_BAGS bags
+# of every game at once into a (games, bags, bag_size) array, and a cursor
+# per game points to its next tetromino. Spawning takes the tetrominoes at
+# the cursors of all games with one index, only the buffers of games which
+# have used up all their bags are packed again. The stream of a game is the
+# same an Unpacker with the same packer and seed would spawn.
+
+import logging
+import logging_conf
+import numpy as np
+from typing import Optional, Sequence, Tuple
+# own modules
+import absolon
+import old_generator as generator
+
+
+# Setup logging
+logging_conf.configure()
+logger = logging.getLogger(__name__)
+
+
+BUFFERED_BAGS = 64
+
+class Batch_Environment():
+    """
+    N games of absolon stepped in lockstep.
+    A game which tops out is reset in the same step.
+    """
+    def __init__(self,
+                 games: int,
+                 seeds: Optional[Sequence[int]] = None,
+                 packer_name: str = "one_I_in_7_permutation",
+                 rows: int = 24,
+                 columns: int = 10,
+                 boards: Optional[np.ndarray] = None) -> None:
+        """
+        boards can be a (games, rows, columns) uint8 array to hold the boards,
+        e.g. a view of shared memory. It is cleared.
+        """
+        if seeds is None:
+            seeds = range(games)
+        if len(seeds) != games:
+            raise ValueError(f"Got {len(seeds)} seeds for {games} games")
+        self.games = games
+        self.rows = rows
+        self.columns = columns
+        if boards is None:
+            boards = np.zeros((games, rows, columns), dtype=np.uint8)
+        elif boards.shape != (games, rows, columns) or boards.dtype != np.uint8:
+            raise ValueError(f"Boards of shape {boards.shape} and type {boards.dtype} cannot hold {games} boards of {rows}x{columns}")
+        else:
+            boards[:] = absolon.EMPTY
+        self.boards = boards
+        self.packer = generator.packer_dict[packer_name]
+        self.sources = [generator.Block_Source(seed) for seed in seeds]
+        self.bags = np.empty((games, BUFFERED_BAGS, self.packer.bag_size), dtype=np.uint8)
+        # the tetrominoes of every game in the order they spawn
+        self.queue = self.bags.reshape(games, -1)
+        self.cursors = np.zeros(games, dtype=np.int64)
+        self.lines = np.zeros(games, dtype=np.int64)
+        self.placed = np.zeros(games, dtype=np.int64)
+        self._index = np.arange(games)
+        self.pack(self._index)
+        self.pieces = np.zeros(games, dtype=np.int64)
+        self.spawn()
+    def reset(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Empties the boards of the games selected by mask (all games by default).
+        The games keep drawing from their own streams.
+        """
+        if mask is None:
+            mask = np.ones(self.games, dtype=bool)
+        self.boards[mask] = absolon.EMPTY
+        self.lines[mask] = 0
+        self.placed[mask] = 0
+        return self.boards
+    def pack(self, games: np.ndarray) -> None:
+        """
+        Fills the bag buffers of the given games from their random sources.
+        """
+        for game in games.tolist():
+            self.packer.bags(self.sources[game], BUFFERED_BAGS, out=self.bags[game])
+        self.cursors[games] = 0
+    def spawn(self) -> np.ndarray:
+        """
+        Makes the next tetromino of every game its current one.
+        """
+        self.pieces[:] = self.queue[self._index, self.cursors]
+        self.cursors += 1
+        exhausted = self.cursors == self.queue.shape[1]
+        if exhausted.any():
+            self.pack(np.flatnonzero(exhausted))
+        return self.pieces
+    def surfaces(self) -> np.ndarray:
+        """
+        Returns the row of the topmost occupied cell of every column
+        of every board, or the number of rows for empty columns.
+        """
+        return absolon.column_surfaces(self.boards)
+    def features(self) -> np.ndarray:
+        """
+        Returns the feature vector of every board, see absolon.board_features.
+        """
+        return absolon.board_features(self.boards)
+    def clear_lines(self) -> np.ndarray:
+        """
+        Removes the full rows of all boards and returns the number
+        of cleared lines per board.
+        """
+        return absolon.clear_full_rows(self.boards)
+    def step(self, rotations: np.ndarray, columns: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Drops the current tetromino of every game into its board.
+
+        Columns which would push a tetromino over the right wall are moved
+        to the rightmost possible column.
+        Returns the boards, the cleared lines and which games topped out
+        (and were reset) in this step.
+        """
+        rotations = np.asarray(rotations, dtype=np.int64) % 4
+        columns = np.clip(np.asarray(columns, dtype=np.int64), 0, self.columns - absolon.WIDTHS[self.pieces, rotations])
+        top_rows = absolon.landing_tops(self.surfaces(), self.rows, self.pieces, rotations, columns)
+        topped_out = top_rows < 0
+        landed = ~topped_out
+        offsets = absolon.OFFSETS[self.pieces, rotations]
+        cell_rows = top_rows[:, None] + offsets[..., 1]
+        cell_columns = columns[:, None] + offsets[..., 0]
+        games = np.repeat(self._index[landed], 4)
+        self.boards[games, cell_rows[landed].ravel(), cell_columns[landed].ravel()] = np.repeat(self.pieces[landed] + 1, 4)
+        cleared = self.clear_lines()
+        self.lines += cleared
+        self.placed += landed
+        if topped_out.any():
+            logger.debug("%d games topped out", topped_out.sum())
+            self.reset(topped_out)
+        self.spawn()
+        return self.boards, cleared, topped_out
@@ -0,0 +1,178 @@
+# This module measures the throughput of the hot paths of absolutris.
+#
+# A benchmark is a callable doing one operation on some number of items,
+# e.g. drawing one number from a random source or one bag from a packer.
+# It is timed like timeit does: the number of calls is calibrated to run
+# for about 0.2 seconds, the calls are repeated several times and the
+# fastest repetition counts, as the slower ones only measure disturbances.
+#
+# The renderer benchmarks open the game window under the SDL dummy video
+# driver, so they run headless and do not depend on a display.
+#
+# The results can be written as JSON and compared against the JSON of an
+# earlier run, the baseline. A benchmark which is slower than its baseline
+# by more than the tolerance is a regression, and the exit code is 1.
+
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+import logging
+import logging_conf
+import numpy as np
+from collections import namedtuple
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+# own modules
+import old_generator as generator
+
+
+# Setup logging
+logging_conf.configure()
+# named after the module, also when it runs as the script "__main__"
+logger = logging.getLogger("benchmark")
+
+
+Benchmark = namedtuple("Benchmark", "name, function, items")
+# bags per call of the bulk packer benchmarks
+BULK_BAGS = 64
+
+
+def generator_benchmarks() -> Iterator[Benchmark]:
+    for name, factory in generator.rs_factories.items():
+        rs = factory(9001)
+        yield Benchmark(f"rs_factories[{name}].next", rs.next, 1)
+        yield Benchmark(f"rs_factories[{name}].take(4096)", lambda rs=rs: rs.take(4096), 4096)
+    for name, packer in generator.packer_dict.items():
+        rs = generator.Block_Source(9001)
+        yield Benchmark(f"packer_dict[{name}].bag", lambda packer=packer, rs=rs: packer.bag(rs), packer.bag_size)
+        out = np.empty((BULK_BAGS, packer.bag_size), dtype=np.uint8)
+        yield Benchmark(f"packer_dict[{name}].bags({BULK_BAGS})",
+                        lambda packer=packer, rs=rs, out=out: packer.bags(rs, BULK_BAGS, out), BULK_BAGS * packer.bag_size)
+    for rs_name in ("randint06", "pcg64"):
+        unpacker = generator.new_unpacker("one_I_in_7_permutation", rs_name, 9001)
+        yield Benchmark(f"Unpacker({rs_name}).spawn_next", unpacker.spawn_next, 1)
+        yield Benchmark(f"Unpacker({rs_name}).preview_next(6)", lambda unpacker=unpacker: list(unpacker.preview_next(6)), 6)
+        yield Benchmark(f"Unpacker({rs_name}).peek(50)", lambda unpacker=unpacker: unpacker.peek(50), 50)
+        yield Benchmark(f"Unpacker({rs_name}).snapshot + restore",
+                        lambda unpacker=unpacker: unpacker.restore(unpacker.snapshot()), 1)
+
+
+def renderer_benchmarks(game) -> Iterator[Benchmark]:
+    """
+    Needs a game whose window is set up.
+    """
+    import pygame
+    import old_tetrominoes as tetrominoes
+    for tetromino_class in tetrominoes.mapping.values():
+        yield Benchmark(f"{tetromino_class.__name__}()", tetromino_class, 1)
+    atlas = tetrominoes.sprite_atlas
+    yield Benchmark("Sprite_Atlas.colorize_all", atlas.colorize_all, len(atlas.color_dict))
+    tetromino = tetrominoes.Tetromino_T()
+    def draw_and_clear() -> None:
+        game.pf.draw_tetromino(tetromino)
+        game.pf.clear_all_tiles()
+        game.list_of_rectangles_to_update.clear()
+    yield Benchmark("Playfield.draw_tetromino + clear_all_tiles", draw_and_clear, 1)
+    def clear_full() -> None:
+        game.pf.board.grid[:] = 1
+        game.pf.board.recount()
+        game.pf.sync()
+        game.pf.clear_all_tiles()
+        game.list_of_rectangles_to_update.clear()
+    yield Benchmark("Playfield.clear_all_tiles (full board)", clear_full, 1)
+    def idle_frame() -> None:
+        game.run_frame()
+    yield Benchmark("Game.run_frame (idle)", idle_frame, 1)
+    keys = (pygame.K_n, pygame.K_n, pygame.K_q)
+    pressed = iter(range(sys.maxsize))
+    def input_frame() -> None:
+        pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=keys[next(pressed) % len(keys)], mod=0))
+        game.run_frame()
+    yield Benchmark("Game.run_frame (spawn/clear input)", input_frame, 1)
+
+
+def setup_game(config_file: Path):
+    """
+    Sets up the game window under the dummy video driver, without recording replays.
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import absolutris
+    game = absolutris.Game(config_file)
+    game.framerate = 0
+    game.record_replays = False
+    game.log_queue = False
+    game.histogram_file = None
+    game.setup()
+    game.setup_engine()
+    game.frame = 0
+    game.pygame_running = True
+    return game
+
+
+def measure(benchmark: Benchmark, repeat: int) -> Dict[str, float]:
+    timer = timeit.Timer(benchmark.function)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat, number)) / number
+    return {"seconds_per_call": best, "items_per_second": benchmark.items / best}
+
+
+def run(benchmarks: List[Benchmark], repeat: int = 5, only: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for benchmark in benchmarks:
+        if only and only not in benchmark.name:
+            continue
+        results[benchmark.name] = measure(benchmark, repeat)
+        print(f"{benchmark.name:50} {results[benchmark.name]['items_per_second']:14.0f} items/s")
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """
+    Returns the names of the benchmarks which got slower than
+    their baseline by more than tolerance (0.1 for 10 %).
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["seconds_per_call"] / baseline[name]["seconds_per_call"]
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+        print(f"{name:50} {ratio:6.2f}x the baseline time{'  REGRESSION' if ratio > 1 + tolerance else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark absolutris")
+    parser.add_argument("--json", type=Path, help="write the results into this file")
+    parser.add_argument("--baseline", type=Path, help="compare against the results in this file")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown against the baseline, 0.1 for 10 %%")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="run only the benchmarks whose name contains this")
+    parser.add_argument("--headless-only", action="store_true", help="skip the benchmarks which need pygame")
+    parser.add_argument("--config", type=Path, default=Path("config.ini"))
+    arguments = parser.parse_args()
+    logging_conf.set_subsystem_levels({"engine": "WARNING", "generator": "WARNING", "renderer": "WARNING"})
+    benchmarks = list(generator_benchmarks())
+    if not arguments.headless_only:
+        game = setup_game(arguments.config)
+        logging_conf.set_subsystem_levels({"renderer": "WARNING"})
+        benchmarks.extend(renderer_benchmarks(game))
+    results = run(benchmarks, arguments.repeat, arguments.only)
+    if not arguments.headless_only:
+        game.quit()
+    if arguments.json:
+        arguments.json.write_text(json.dumps({"python": platform.python_version(),
+                                              "machine": platform.machine(),
+                                              "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                              "results": results}, indent=4))
+    if arguments.baseline:
+        baseline = json.loads(arguments.baseline.read_text())["results"]
+        regressions = compare(results, baseline, arguments.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions")
+            sys.exit(1)
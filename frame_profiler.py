@@ -0,0 +1,112 @@
+# This module times the phases of every frame of the main game loop.
+#
+# The main loop calls lap(phase) whenever a phase ends, which adds the
+# time since the previous lap to that phase, and end_frame() after the
+# last phase. The phases of absolutris are
+#
+#   update      pygame.display.update of the dirty rects
+#   tick        clock.tick, mostly sleeping to keep the framerate
+#   events      pygame.event.get
+#   input       handling the events
+#   simulation  applying inputs to the engine and recording them
+#   blit        blitting tiles (Playfield.sync) and the overlay
+#
+# The times of the last window frames are kept in a ring buffer for the
+# rolling percentiles shown by the overlay. All frames are also counted
+# into histograms with logarithmic bins from 1 µs to 10 s, which can be
+# written into a JSON file when the game quits.
+
+import json
+import time
+import logging
+import logging_conf
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+
+# Setup logging
+logging_conf.configure()
+logger = logging.getLogger(__name__)
+
+
+PHASES = ("update", "tick", "events", "input", "simulation", "blit")
+# edges of the histogram bins in seconds, 10 bins per decade
+BIN_EDGES = np.logspace(-6, 1, 71)
+
+
+class Frame_Profiler():
+    """
+    Collects the time every frame spends in each phase.
+    """
+    def __init__(self, phases: Sequence[str] = PHASES, window: int = 600, budget: float = 0.0) -> None:
+        self.phases = tuple(phases)
+        self.column = {phase: i for i, phase in enumerate(self.phases)}
+        self.window = window
+        # seconds per frame, frames whose work (all phases but the tick) takes longer are over budget
+        self.budget = budget
+        self.idle = self.column.get("tick")
+        # one row per frame, one column per phase and the total in the last column
+        self.times = np.zeros((window, len(self.phases) + 1))
+        self.current = np.zeros(len(self.phases) + 1)
+        self.histograms = np.zeros((len(self.phases) + 1, len(BIN_EDGES) + 1), dtype=np.int64)
+        self.frames = 0
+        self.over_budget = 0
+        self.stamp = time.perf_counter()
+    def start(self) -> None:
+        """
+        Starts timing the first frame.
+        """
+        self.stamp = time.perf_counter()
+    def lap(self, phase: str) -> None:
+        """
+        Adds the time since the last lap to the phase.
+        """
+        now = time.perf_counter()
+        self.current[self.column[phase]] += now - self.stamp
+        self.stamp = now
+    def end_frame(self) -> None:
+        current = self.current
+        current[-1] = current[:-1].sum()
+        self.times[self.frames % self.window] = current
+        self.histograms[np.arange(len(current)), np.searchsorted(BIN_EDGES, current)] += 1
+        work = current[-1] - (current[self.idle] if self.idle is not None else 0.0)
+        if self.budget and work > self.budget:
+            self.over_budget += 1
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Frame %d took %.1f ms: %s", self.frames, current[-1] * 1000,
+                             ", ".join(f"{phase} {current[i] * 1000:.1f}" for i, phase in enumerate(self.phases)))
+        self.frames += 1
+        current[:] = 0
+    def percentiles(self) -> Dict[str, List[float]]:
+        """
+        Returns the p50, p99 and max of every phase and the total in seconds,
+        over the last window frames.
+        """
+        times = self.times[:min(self.frames, self.window)]
+        if not len(times):
+            return {}
+        p50, p99, high = np.percentile(times, 50, axis=0), np.percentile(times, 99, axis=0), times.max(axis=0)
+        return {phase: [p50[i], p99[i], high[i]] for i, phase in enumerate(self.phases + ("total",))}
+    def overlay_lines(self) -> List[str]:
+        lines = [f"{'ms':10} {'p50':>6} {'p99':>6} {'max':>6}"]
+        for phase, values in self.percentiles().items():
+            lines.append(f"{phase:10} " + " ".join(f"{value * 1000:6.2f}" for value in values))
+        if self.budget:
+            lines.append(f"over budget {self.over_budget}/{self.frames}")
+        return lines
+    def export(self, path: Path) -> None:
+        """
+        Writes the histograms of all frames into a JSON file. Count n of a
+        phase is the number of frames with times in (bin_edges[n - 1], bin_edges[n]].
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"frames": self.frames,
+                                    "budget": self.budget,
+                                    "over_budget": self.over_budget,
+                                    "bin_edges": BIN_EDGES.tolist(),
+                                    "histograms": {phase: counts.tolist()
+                                                   for phase, counts in zip(self.phases + ("total",), self.histograms)},
+                                    "percentiles": self.percentiles()}, indent=1))
+        logger.info("Wrote the frame time histograms of %d frames to %s", self.frames, path)
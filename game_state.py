@@ -0,0 +1,146 @@
+# This module holds absolon games as immutable states for tree search.
+#
+# A search bot branches on every placement of every tetromino, so it keeps
+# a state per node and must create children cheaply. A Game_State holds
+#
+#   stack       the occupied rows as bitmasks, bit n for column n, from the
+#               floor up to the topmost occupied row
+#   piece       the current tetromino
+#   lines       lines cleared so far
+#   pieces      tetrominoes placed so far
+#   generator   the snapshot of the Unpacker after spawning piece
+#
+# apply_placement() returns a new state and never changes its parent. The
+# new stack is a new tuple, but it refers to the same row objects as the
+# parent's for every row the tetromino does not touch. The placements of
+# one state share the next tetromino and generator snapshot, which is
+# drawn once per state. A state takes less than 300 bytes, so a million
+# nodes fit in about 300 MB.
+#
+# The stack only tells which cells are occupied, not by which tetromino.
+# Placements follow absolon.Board.place: the tetromino is dropped from
+# above the playfield and the placement fails if it sticks out at the top.
+
+import logging
+import logging_conf
+import numpy as np
+from functools import lru_cache
+from typing import Iterator, Optional, Tuple
+# own modules
+import absolon
+
+
+# Setup logging
+logging_conf.configure()
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def row_masks(piece: int, rotation: int, column: int) -> Tuple[int, ...]:
+    """
+    Returns the bitmasks of the rows of a tetromino whose leftmost mino
+    is in column, from the bottom of its bounding box up.
+    """
+    shape = absolon.ROTATIONS[piece][rotation]
+    masks = [0] * shape.height
+    for offset in shape.offsets:
+        masks[shape.height - 1 - offset.row] |= 1 << (column + offset.column)
+    return tuple(masks)
+
+
+class Game_State():
+    """
+    An immutable state of a headless game, see the top of the module.
+    """
+    __slots__ = ("stack", "piece", "lines", "pieces", "generator", "rows", "columns", "_next")
+    def __init__(self,
+                 stack: Tuple[int, ...],
+                 piece: int,
+                 lines: int,
+                 pieces: int,
+                 generator,
+                 rows: int = 24,
+                 columns: int = 10) -> None:
+        self.stack = stack
+        self.piece = piece
+        self.lines = lines
+        self.pieces = pieces
+        self.generator = generator
+        self.rows = rows
+        self.columns = columns
+        # the next tetromino and generator snapshot, shared by all children
+        self._next: Optional[Tuple[int, object]] = None
+    def __repr__(self):
+        return f"Game_State(piece={self.piece}, lines={self.lines}, pieces={self.pieces}, height={len(self.stack)})"
+    @classmethod
+    def from_engine(cls, engine: absolon.Engine) -> "Game_State":
+        grid = engine.board.grid
+        weights = 1 << np.arange(engine.board.columns, dtype=np.int64)
+        masks = ((grid[::-1] != absolon.EMPTY) @ weights).tolist()
+        while masks and not masks[-1]:
+            masks.pop()
+        return cls(tuple(masks), engine.piece, engine.lines, engine.pieces, engine.unpacker.snapshot(),
+                   engine.board.rows, engine.board.columns)
+    def occupied(self) -> np.ndarray:
+        """
+        Returns the (rows, columns) grid of occupied cells.
+        """
+        grid = np.zeros((self.rows, self.columns), dtype=bool)
+        if self.stack:
+            bits = np.array(self.stack, dtype=np.int64)[:, None] >> np.arange(self.columns) & 1
+            grid[self.rows - len(self.stack):] = bits[::-1].astype(bool)
+        return grid
+    def next_piece(self, unpacker) -> Tuple[int, object]:
+        """
+        Returns the tetromino after piece and the generator snapshot after
+        spawning it, drawing them from unpacker the first time.
+        """
+        if self._next is None:
+            unpacker.restore(self.generator)
+            piece = unpacker.spawn_next()
+            self._next = piece, unpacker.snapshot()
+        return self._next
+    def apply_placement(self, rotation: int, column: int, unpacker) -> Optional["Game_State"]:
+        """
+        Returns the state after placing the current tetromino, or None
+        if the placement is impossible. unpacker is only used to draw the
+        next tetromino, its own state does not matter.
+        """
+        shape = absolon.ROTATIONS[self.piece][rotation]
+        if not 0 <= column <= self.columns - shape.width:
+            return None
+        masks = row_masks(self.piece, rotation, column)
+        stack = self.stack
+        height = len(stack)
+        # drop from the top of the stack until the next row down collides
+        bottom = height
+        while bottom:
+            below = bottom - 1
+            if any(stack[row] & mask for row, mask in zip(range(below, height), masks)):
+                break
+            bottom = below
+        top = bottom + len(masks)
+        if top > self.rows:
+            return None
+        rows = list(stack)
+        if top > height:
+            rows.extend([0] * (top - height))
+        for row, mask in enumerate(masks, start=bottom):
+            rows[row] |= mask
+        full = (1 << self.columns) - 1
+        kept = [row for row in rows[bottom:top] if row != full]
+        cleared = len(masks) - len(kept)
+        if cleared:
+            rows[bottom:top] = kept
+        piece, generator = self.next_piece(unpacker)
+        return Game_State(tuple(rows), piece, self.lines + cleared, self.pieces + 1, generator, self.rows, self.columns)
+    def children(self, unpacker) -> Iterator[Tuple[Tuple[int, int], "Game_State"]]:
+        """
+        Yields every possible placement of the current tetromino with
+        the state after it, one rotation per distinct shape.
+        """
+        for rotation in absolon.DISTINCT_ROTATIONS[self.piece]:
+            for column in range(self.columns - absolon.ROTATIONS[self.piece][rotation].width + 1):
+                child = self.apply_placement(rotation, column, unpacker)
+                if child is not None:
+                    yield (rotation, column), child
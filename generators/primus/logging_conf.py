@@ -5,6 +5,16 @@
 # Author: Sven Siegmund
 # Version 2
 
+import atexit
+import logging
+import logging.config
+import logging.handlers
+import queue
+
+# The level of all loggers whose level is not set, e.g. by set_subsystem_levels.
+# Libraries using the engine or the generators log nothing below it.
+DEFAULT_LEVEL = "WARNING"
+
 file_formatter_conf = {
     "format": "{asctime},{msecs:03.0f} {levelname:>9s} {module} {funcName}: {message}",
     "style": "{",
@@ -22,16 +32,17 @@ formatters_dict = {
     "console_formatter": console_formatter_conf,
 }
 
+# The handlers pass everything, the levels of the loggers decide what is written
 root_console_handler_conf = {
     "class": "logging.StreamHandler",
-    "level": "DEBUG",
+    "level": "NOTSET",
     "formatter": "console_formatter",
     "stream": "ext://sys.stdout",
 }
 
 root_file_handler_conf = {
     "class": "logging.FileHandler",
-    "level": "DEBUG",
+    "level": "NOTSET",
     "formatter": "file_formatter",
     "filename": "debug.log",
     "mode": "w",
@@ -56,12 +67,12 @@ handlers_dict = {
 custom_logger_conf = {
     "propagate": True,
     "handlers": ["custom_file_handler"],
-    "level": "DEBUG",
+    "level": DEFAULT_LEVEL,
 }
 
 root_logger_conf = {
     "handlers": ["root_file_handler", "root_console_handler"],
-    "level": "DEBUG",
+    "level": DEFAULT_LEVEL,
 }
 
 loggers_dict = {
@@ -105,3 +116,66 @@ def set_logfile_path(log_file_path: str) -> None:
     """
     global dict_config
     dict_config["handlers"]["root_file_handler"]["filename"] = log_file_path
+
+
+# Loggers of the subsystems whose levels can be set separately
+subsystem_loggers = {
+    "engine": ("absolon", "batch_env", "replay", "server", "tournament", "observation", "game_state"),
+    "generator": ("old_generator", "generator", "generators", "shared_sequence"),
+    "renderer": ("absolutris", "old_tetrominoes", "tetrominoes", "frame_profiler", "asset_bundle", "tilemap", "hud"),
+}
+
+configured = False
+queue_listener = None
+
+
+def configure() -> None:
+    """
+    Applies dict_config once per process. Modules call this instead of
+    logging.config.dictConfig, so importing another module does not
+    reopen the log files or replace the handlers of a running queue listener.
+    """
+    global configured
+    if not configured:
+        logging.config.dictConfig(dict_config)
+        configured = True
+
+
+def set_subsystem_levels(levels: dict) -> None:
+    """
+    Sets the level of each subsystem's loggers, e.g.
+
+        logging_conf.set_subsystem_levels({"engine": "WARNING", "renderer": "DEBUG"})
+    """
+    for subsystem, level in levels.items():
+        for name in subsystem_loggers[subsystem]:
+            logging.getLogger(name).setLevel(level)
+
+
+def start_queue_listener() -> logging.handlers.QueueListener:
+    """
+    Moves the handlers of the root logger to a background thread.
+    The root logger only puts records into a queue, the thread
+    formats them and writes them to the console and the files.
+    """
+    global queue_listener
+    if queue_listener is None:
+        configure()
+        root = logging.getLogger()
+        log_queue = queue.SimpleQueue()
+        queue_listener = logging.handlers.QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+        root.handlers = [logging.handlers.QueueHandler(log_queue)]
+        queue_listener.start()
+        atexit.register(stop_queue_listener)
+    return queue_listener
+
+
+def stop_queue_listener() -> None:
+    """
+    Writes the records still in the queue and gives the handlers back to the root logger.
+    """
+    global queue_listener
+    if queue_listener is not None:
+        queue_listener.stop()
+        logging.getLogger().handlers = list(queue_listener.handlers)
+        queue_listener = None
@@ -1,58 +1,127 @@
+import bisect
 import numpy
 import logging
-import logging.config
 import logging_conf
+from typing import List
 
 
 #Setup logging
-logging.config.dictConfig(logging_conf.dict_config)
-logger = logging.getLogger(__name__)
-
-def gen_primes():
-    """ # Sieve of Eratosthenes
-        # Code by David Eppstein, UC Irvine, 28 Feb 2002
-        # http://code.activestate.com/recipes/117119/
-        Generate an infinite sequence of prime numbers.
+logging_conf.configure()
+# named after the module, also when it runs as the script "__main__"
+logger = logging.getLogger("generators.primus.primus")
+
+
+def simple_sieve(limit: int) -> numpy.ndarray:
+    """
+    Returns all primes below limit, by the plain sieve of Eratosthenes.
+    """
+    is_prime = numpy.ones(max(limit, 2), dtype=bool)
+    is_prime[:2] = False
+    for p in range(2, int(limit ** 0.5) + 1):
+        if is_prime[p]:
+            is_prime[p * p::p] = False
+    return numpy.flatnonzero(is_prime)
+
+
+class Prime_Digits():
+    """
+    Generates the last base 7 digit (prime % 7) of the primes 2, 3, 5, 7, 11, ...
+
+    The primes are found by a segmented sieve of Eratosthenes. Only the
+    current segment and the primes up to the square root of its end are
+    held in memory, so memory stays bounded however long the stream runs.
+    The stream can be positioned on the k-th prime with seek(k). The index
+    of the first prime of every segment counted so far is kept, so a seek
+    sieves only the segment it lands in and the segments beyond the last
+    one counted.
     """
-    # Maps composites to primes witnessing their compositeness.
-    # This is memory efficient, as the sieve is not "run forward"
-    # indefinitely, but only as long as required by the current
-    # number being tested.
-    #
-    D = {}
-    
-    # The running integer that's checked for primeness
-    q = 2
-    
-    while True:
-        if q not in D:
-            # q is a new prime.
-            # Yield it and mark its first multiple that isn't
-            # already marked in previous iterations
-            # 
-            yield q
-            D[q * q] = [q]
+    def __init__(self, segment_size: int = 1 << 18) -> None:
+        self.segment_size = segment_size
+        self.base_primes = simple_sieve(2)
+        self.base_limit = 2
+        # starts[n] is the index of the first prime of segment n
+        self.starts = [0]
+        self.seek(0)
+    def __repr__(self):
+        return f"Prime_Digits(position={self.tell()})"
+    def primes_for(self, high: int) -> numpy.ndarray:
+        """
+        Returns the primes needed to sieve numbers below high.
+        """
+        limit = int(high ** 0.5) + 1
+        if limit > self.base_limit:
+            # grow with some headroom, so this happens rarely
+            self.base_limit = 2 * limit
+            self.base_primes = simple_sieve(self.base_limit)
+        return self.base_primes[self.base_primes < limit]
+    def sieve_segment(self, low: int) -> numpy.ndarray:
+        """
+        Returns the primes in [low, low + segment_size).
+        """
+        high = low + self.segment_size
+        is_prime = numpy.ones(self.segment_size, dtype=bool)
+        if low < 2:
+            is_prime[:2 - low] = False
+        for p in self.primes_for(high).tolist():
+            start = max(p * p, -(-low // p) * p)
+            is_prime[start - low::p] = False
+        return numpy.flatnonzero(is_prime) + low
+    def load_segment(self, index: int) -> None:
+        self.segment_index = index
+        self.digits: List[int] = (self.sieve_segment(index * self.segment_size) % 7).tolist()
+        if index + 1 == len(self.starts):
+            self.starts.append(self.starts[index] + len(self.digits))
+    def seek(self, k: int) -> None:
+        """
+        Positions the stream on the k-th prime, counting from 0.
+        Segments not counted before are only counted, not kept.
+        """
+        starts = self.starts
+        while starts[-1] <= k:
+            starts.append(starts[-1] + len(self.sieve_segment((len(starts) - 1) * self.segment_size)))
+        index = bisect.bisect_right(starts, k) - 1
+        self.load_segment(index)
+        self.first = starts[index]
+        self.offset = k - self.first
+    def tell(self) -> int:
+        """
+        Returns the position of the next prime in the stream.
+        """
+        return self.first + self.offset
+    def get_state(self) -> int:
+        return self.tell()
+    def set_state(self, k: int) -> None:
+        if self.first <= k < self.first + len(self.digits):
+            self.offset = k - self.first
         else:
-            # q is composite. D[q] is the list of primes that
-            # divide it. Since we've reached q, we no longer
-            # need it in the map, but we'll mark the next 
-            # multiples of its witnesses to prepare for larger
-            # numbers
-            # 
-            for p in D[q]:
-                D.setdefault(p + q, []).append(p)
-            del D[q]
-        
-        q += 1
-
-def return_last_digit():
-    for prime in gen_primes():
-        # convert it to base 7:
-        prime7 = numpy.base_repr(prime, base=7)
-        # return the last digit:
-        yield int(prime7[-1], base=7)
-
-number_generator = return_last_digit()
+            self.seek(k)
+    def __next__(self) -> int:
+        while self.offset >= len(self.digits):
+            self.first += len(self.digits)
+            self.offset -= len(self.digits)
+            self.load_segment(self.segment_index + 1)
+        digit = self.digits[self.offset]
+        self.offset += 1
+        return digit
+    def next(self) -> int:
+        return self.__next__()
+    def take(self, n: int) -> numpy.ndarray:
+        result = numpy.empty(n, dtype=numpy.uint8)
+        filled = 0
+        while filled < n:
+            if self.offset >= len(self.digits):
+                self.first += len(self.digits)
+                self.offset -= len(self.digits)
+                self.load_segment(self.segment_index + 1)
+                continue
+            chunk = min(n - filled, len(self.digits) - self.offset)
+            result[filled:filled + chunk] = self.digits[self.offset:self.offset + chunk]
+            filled += chunk
+            self.offset += chunk
+        return result
+
+
+number_generator = Prime_Digits()
 
 def generate():
     return next(number_generator)
@@ -60,4 +129,4 @@ def generate():
 
 if __name__ == "__main__":
     for _ in range(20):
-        logger.debug(f"{generate()}")
+        logger.debug("%s", generate())
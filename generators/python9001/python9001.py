@@ -1,11 +1,11 @@
 import random
 
 
-random.seed(9001)
+own_random = random.Random(9001)
 
 
 def generate():
-    return random.randint(0, 6)
+    return own_random.randint(0, 6)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,73 @@
+# This module draws the text fields of the head-up display.
+#
+# A field is a label and a value at a fixed position of the window, e.g.
+# "lines 12". Its text is rendered from the glyph atlas of an
+# asset_bundle.Glyph_Font, rasterized once from the font file at the font
+# size of the resolution, so drawing text is a single Surface.blits call
+# and no glyph is rasterized while the game runs.
+#
+# The Hud remembers the text every field shows. Updating a field with the
+# value it already shows does nothing. Otherwise the rect of the old text
+# is filled with the background, the new text is drawn, and the union of
+# both rects is added to the rects to update. Updating all fields every
+# frame therefore costs only a few string comparisons while the values
+# stay the same.
+
+import logging
+import logging_conf
+import pygame
+from collections import namedtuple
+from typing import Dict, Tuple
+# own modules
+import asset_bundle
+
+
+# Setup logging
+logging_conf.configure()
+logger = logging.getLogger(__name__)
+
+
+Hud_Field = namedtuple("Hud_Field", "position, template")
+
+
+class Hud():
+    """
+    Text fields drawn on surface with font, see the top of the module.
+    """
+    def __init__(self,
+                 surface: pygame.Surface,
+                 font: asset_bundle.Glyph_Font,
+                 color: pygame.Color,
+                 background_color: pygame.Color,
+                 rects_to_update: list) -> None:
+        self.surface = surface
+        self.font = font
+        self.color = color
+        self.background_color = background_color
+        self.rects_to_update = rects_to_update
+        self.fields: Dict[str, Hud_Field] = {}
+        # the text and the rect every field shows
+        self.shown: Dict[str, Tuple[str, pygame.Rect]] = {}
+    def add_field(self, name: str, position: Tuple[int, int], template: str) -> None:
+        """
+        Adds a field whose text is template.format(value), e.g. "lines {}".
+        """
+        self.fields[name] = Hud_Field(position, template)
+        self.shown[name] = ("", pygame.Rect(position, (0, 0)))
+    def set(self, name: str, value) -> None:
+        """
+        Draws a field if its text changes.
+        """
+        field = self.fields[name]
+        text = field.template.format(value)
+        shown_text, shown_rect = self.shown[name]
+        if text == shown_text:
+            return
+        if shown_rect:
+            self.surface.fill(self.background_color, shown_rect)
+        rect = self.font.render_to(self.surface, field.position, text, fgcolor=self.color)
+        self.shown[name] = (text, rect)
+        self.rects_to_update.appendr(rect.union(shown_rect) if shown_rect else rect)
+    def update(self, **values) -> None:
+        for name, value in values.items():
+            self.set(name, value)
@@ -0,0 +1,154 @@
+# This module writes the observations of absolon games into buffers the
+# caller provides, for rollout workers feeding a learner.
+#
+# An observation is one record of a NumPy structured type:
+#
+#   board       the uint8 grid of the Board, (rows, columns)
+#   piece       the current tetromino
+#   preview     the next tetrominoes, as the Unpacker previews them
+#   features    the feature vector of the Board, see absolon.board_features
+#
+# The records of many games form one array, which can be a view of any
+# writable buffer: a NumPy array, a bytearray, a memoryview or the buffer
+# of multiprocessing.shared_memory. An Observer attaches the Board of an
+# Engine to its record, so locks and line clears write the board and the
+# features straight into the buffer, and only the piece and the preview
+# are copied after a step. A learner process which maps the same shared
+# memory reads the observations without pickling anything.
+#
+# The buffer has no locks. Workers and the learner have to agree on when
+# a record is complete, e.g. by a message or a barrier after every step.
+
+import logging
+import logging_conf
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Optional
+# own modules
+import absolon
+
+
+# Setup logging
+logging_conf.configure()
+# named after the module, also when it runs as the script "__main__"
+logger = logging.getLogger("observation")
+
+
+PREVIEW = 6
+
+
+def observation_dtype(rows: int = 24, columns: int = 10, preview: int = PREVIEW) -> np.dtype:
+    return np.dtype([("board", np.uint8, (rows, columns)),
+                     ("piece", np.uint8),
+                     ("preview", np.uint8, (preview,)),
+                     ("features", np.int64, (columns + len(absolon.FEATURE_NAMES),))], align=True)
+
+
+def observation_array(buffer, dtype: np.dtype, count: int, offset: int = 0) -> np.ndarray:
+    """
+    Returns count observations as a view of a writable buffer.
+    """
+    return np.ndarray((count,), dtype=dtype, buffer=buffer, offset=offset)
+
+
+class Shared_Observations():
+    """
+    count observations in shared memory. Creates the memory if name is None,
+    otherwise maps the memory another process created.
+    """
+    def __init__(self, count: int, dtype: np.dtype, name: Optional[str] = None) -> None:
+        self.count = count
+        self.dtype = dtype
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=count * dtype.itemsize)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.array = observation_array(self.shm.buf, dtype, count)
+        if self.owner:
+            self.array[...] = np.zeros((), dtype=dtype)
+            logger.debug("Sharing %d observations of %d bytes in %s", count, dtype.itemsize, self.name)
+    @property
+    def name(self) -> str:
+        return self.shm.name
+    def close(self) -> None:
+        """
+        Unmaps the memory, and frees it if this process created it.
+        Views of the array must be dropped before.
+        """
+        del self.array
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class Observer():
+    """
+    Writes the observation of an Engine into record slot of observations.
+    """
+    def __init__(self, engine: absolon.Engine, observations: np.ndarray, slot: int = 0) -> None:
+        self.engine = engine
+        self.board = observations["board"][slot]
+        self.features = observations["features"][slot]
+        self.piece = observations["piece"][slot:slot + 1]
+        self.preview = observations["preview"][slot]
+        if self.board.shape != engine.board.grid.shape:
+            raise ValueError(f"An observation of a {self.board.shape} board cannot hold a {engine.board.grid.shape} board")
+        engine.board.attach(self.board, self.features)
+        self.write()
+    def write(self) -> None:
+        """
+        Writes the current and the next tetrominoes, the board and its
+        features are always up to date.
+        """
+        self.piece[0] = self.engine.piece
+        self.preview[:] = list(self.engine.unpacker.preview_next(len(self.preview)))
+
+
+def play(name: str, count: int, slot: int, placements: int, seed: int, results) -> None:
+    """
+    A rollout worker for the demonstration below. It plays greedy_bot
+    and reports its lines, the learner reads the observations.
+    """
+    import old_generator as generator
+    import tournament
+    shared = Shared_Observations(count, observation_dtype(), name)
+    engine = absolon.Engine(generator.new_unpacker("one_I_in_7_permutation", "pcg64", seed))
+    observer = Observer(engine, shared.array, slot)
+    for _ in range(placements):
+        if engine.topped_out:
+            engine.board.clear()
+            engine.topped_out = False
+        engine.step(*tournament.greedy_bot(engine.board, engine.piece))
+        observer.write()
+    results.put((slot, engine.lines, engine.piece))
+    # the board is a view of the shared memory
+    del observer, engine
+    shared.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import multiprocessing
+    parser = argparse.ArgumentParser(description="Share the observations of rollout workers with a learner")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--placements", type=int, default=2000)
+    arguments = parser.parse_args()
+    logging_conf.set_subsystem_levels({"engine": "WARNING", "generator": "WARNING"})
+    shared = Shared_Observations(arguments.workers, observation_dtype())
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=play, args=(shared.name, arguments.workers, slot, arguments.placements, slot, results))
+               for slot in range(arguments.workers)]
+    for worker in workers:
+        worker.start()
+    reports = sorted(results.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+    observations = shared.array
+    print(f"{arguments.workers} workers, {observations.dtype.itemsize} bytes per observation")
+    for slot, lines, piece in reports:
+        print(f"worker {slot}: {lines} lines, piece {observations['piece'][slot]} (sent {piece}),",
+              "features match the board:", np.array_equal(observations["features"][slot],
+                                                          absolon.board_features(observations["board"][slot])))
+    del observations
+    shared.close()
@@ -15,28 +15,37 @@
 # The unpacker unpacks these bags and offers the preview of x next
 # tetrominoes, e.g. 3 next tetrominoes.
 # The unpacker yields the first next tetromino to the program.
+#
+# The state of the whole pipeline, the rest of the current bag, the next
+# tetrominoes and the state of the random source, is a small snapshot an
+# Unpacker can be restored to, and peek looks arbitrarily far ahead without
+# advancing the stream, e.g. for bots which search the future tetrominoes.
 
 
-import generators.python9001.python9001 as gen
 import generators.ones.ones as ones
 import generators.primus.primus as primus
-from collections import deque
-from typing import Callable
+from abc import ABC, abstractmethod
+from collections import deque, namedtuple
+from itertools import islice, permutations
+from typing import Callable, Hashable, Iterator, List, Optional, Tuple
+import numpy as np
 import random
 import logging
-import logging.config
 import logging_conf
 
 # Setup logging
-logging.config.dictConfig(logging_conf.dict_config)
-logger = logging.getLogger(__name__)
+logging_conf.configure()
+# named after the module, also when it runs as the script "__main__"
+logger = logging.getLogger("old_generator")
 
 
 class Random_Source():
     """
     This is a wrapper for a python-like random integer function.
+    If the function draws from its own random.Random instance, pass
+    its getstate and setstate to be able to save and restore the stream.
     """
-    def __init__(self, seed=None, set_seed=None, function=None, args=(), kwargs={}):
+    def __init__(self, seed=None, set_seed=None, function=None, args=(), kwargs={}, get_state=None, set_state=None):
         self.seed = seed
         self.set_seed = set_seed
         # set the seed
@@ -45,10 +54,89 @@ class Random_Source():
         self.function = function
         self.args = args
         self.kwargs = kwargs
+        self._get_state = get_state
+        self._set_state = set_state
     def __next__(self):
         random_number = self.function(*self.args, **self.kwargs)
-        logger.debug(f"Random_Source returning {random_number}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Random_Source returning %s", random_number)
         return random_number
+    def next(self) -> int:
+        return self.__next__()
+    def take(self, n: int) -> np.ndarray:
+        return np.fromiter((self.function(*self.args, **self.kwargs) for _ in range(n)), dtype=np.uint8, count=n)
+    def get_state(self) -> Hashable:
+        if self._get_state is None:
+            raise NotImplementedError("This random source cannot save its state")
+        return self._get_state()
+    def set_state(self, state: Hashable) -> None:
+        if self._set_state is None:
+            raise NotImplementedError("This random source cannot restore its state")
+        self._set_state(state)
+
+
+class Block_Source():
+    """
+    A seedable random source which owns its generator state.
+
+    The stream is cut into blocks of block_size numbers. Block n is filled
+    at once by a PCG64 generator seeded from (seed, n), so the state of the
+    whole stream is just its seed and position. The last few blocks are kept
+    in a ring buffer, so restoring a nearby state does not regenerate anything.
+    """
+    def __init__(self, seed: Optional[int] = None, block_size: int = 4096, ring_blocks: int = 4) -> None:
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.seed = seed
+        self.block_size = block_size
+        self.ring = np.empty((ring_blocks, block_size), dtype=np.uint8)
+        self.ring_held = [-1] * ring_blocks
+        self.position = 0
+        self._values: List[int] = []
+        self._start = 0
+    def __repr__(self):
+        return f"Block_Source(seed={self.seed}, position={self.position})"
+    def block(self, index: int) -> np.ndarray:
+        """
+        Returns block number index of the stream, generating it if it is not in the ring buffer.
+        """
+        slot = index % len(self.ring_held)
+        if self.ring_held[slot] != index:
+            bit_generator = np.random.PCG64(np.random.SeedSequence(self.seed, spawn_key=(index,)))
+            self.ring[slot] = np.random.Generator(bit_generator).integers(0, 7, self.block_size, dtype=np.uint8)
+            self.ring_held[slot] = index
+        return self.ring[slot]
+    def __next__(self) -> int:
+        offset = self.position - self._start
+        if not 0 <= offset < len(self._values):
+            index, offset = divmod(self.position, self.block_size)
+            self._values = self.block(index).tolist()
+            self._start = self.position - offset
+        self.position += 1
+        return self._values[offset]
+    def next(self) -> int:
+        return self.__next__()
+    def take(self, n: int) -> np.ndarray:
+        """
+        Returns the next n numbers of the stream as an array.
+        """
+        result = np.empty(n, dtype=np.uint8)
+        filled = 0
+        while filled < n:
+            index, offset = divmod(self.position, self.block_size)
+            chunk = min(n - filled, self.block_size - offset)
+            result[filled:filled + chunk] = self.block(index)[offset:offset + chunk]
+            filled += chunk
+            self.position += chunk
+        return result
+    def get_state(self) -> Tuple[int, int]:
+        return self.seed, self.position
+    def set_state(self, state: Tuple[int, int]) -> None:
+        seed, self.position = state
+        if seed != self.seed:
+            self.seed = seed
+            self.ring_held = [-1] * len(self.ring_held)
+            self._values = []
 
 
 def one_I_in_7(rs: Random_Source):
@@ -56,6 +144,9 @@ def one_I_in_7(rs: Random_Source):
        A Packer-type function which takes random number from the generator
        and packs them into a deque of seven non-repeating numbers.
        This practically emulates a random.shuffle of [0, 1, 2, 3, 4, 5, 6]
+       by discarding numbers which are already in the bag.
+       Permutation_Packer packs the same kind of bags faster,
+       but from other numbers, so it has a name of its own.
     """
     maxlen = 7
     bag = deque([], maxlen)
@@ -63,29 +154,108 @@ def one_I_in_7(rs: Random_Source):
     while len(bag) < maxlen -1:
         to_append = next(rs)
         if to_append not in bag:
-            logger.debug(f"{to_append} is not in the bag")
+            logger.debug("%s is not in the bag", to_append)
             bag.append(to_append)
-            logger.debug(f"added {to_append} to the bag")
+            logger.debug("added %s to the bag", to_append)
         else:
-            logger.debug(f"discarding {to_append}, it is already in the bag")
+            logger.debug("discarding %s, it is already in the bag", to_append)
     logger.debug("bag is missing one more number.")
     bag_has = set(bag)
-    logger.debug(f"Currently we have: {bag_has}")
+    logger.debug("Currently we have: %s", bag_has)
     bag_hasnt = set(range(maxlen))
     bag_hasnt.difference_update(bag_has)
-    logger.debug(f"but is missing {bag_hasnt}, appending {bag_hasnt}")
+    logger.debug("but is missing %s, appending %s", bag_hasnt, bag_hasnt)
     bag.append(bag_hasnt.pop())
     yield bag
 
 
-def no_rules(rs: Random_Source):
+class Packer(ABC):
+    """
+       A persistent bag engine. It packs the numbers of a random source
+       into bags of bag_size numbers, one bag per bag() call or k bags
+       at once with bags().
+       Calling a packer with a random source returns a generator of one bag,
+       like the Packer-type functions do.
+    """
+    bag_size = 7
+    @abstractmethod
+    def bag(self, rs: Random_Source) -> deque:
+        pass
+    def bags(self, rs: Random_Source, k: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+           Packs k bags into the rows of a (k, bag_size) array.
+           The bags are the same bag() would have packed one after the other.
+        """
+        if out is None:
+            out = np.empty((k, self.bag_size), dtype=np.uint8)
+        for row in range(k):
+            out[row] = self.bag(rs)
+        return out
+    def __call__(self, rs: Random_Source):
+        yield self.bag(rs)
+
+
+class Function_Packer(Packer):
+    """
+       Wraps a Packer-type function, which yields one bag per call.
+    """
+    def __init__(self, function: Callable[[Random_Source], deque], bag_size: int) -> None:
+        self.function = function
+        self.bag_size = bag_size
+    def bag(self, rs: Random_Source) -> deque:
+        return next(self.function(rs))
+
+
+# All orders of the seven tetrominoes, in lexicographic order
+PERMUTATIONS = np.array(list(permutations(range(7))), dtype=np.uint8)
+PERMUTATIONS.flags.writeable = False
+# Five base 7 digits make a number below 7**5 = 16807. Numbers below
+# 3 * 5040 = 15120 map uniformly onto the 5040 permutations, the rest is rejected.
+DIGITS_PER_DRAW = 5
+DIGIT_WEIGHTS = 7 ** np.arange(DIGITS_PER_DRAW)
+ACCEPTED_DRAWS = len(PERMUTATIONS) * (7 ** DIGITS_PER_DRAW // len(PERMUTATIONS))
+
+
+class Permutation_Packer(Packer):
+    """
+       Packs bags of seven non-repeating numbers by picking one of the
+       5040 permutations of [0, 1, 2, 3, 4, 5, 6] directly.
+       Takes 5.6 numbers from the random source per bag on average.
+    """
+    bag_size = 7
+    def bag(self, rs: Random_Source) -> deque:
+        while True:
+            draw = 0
+            for weight in DIGIT_WEIGHTS.tolist():
+                draw += next(rs) * weight
+            if draw < ACCEPTED_DRAWS:
+                return deque(PERMUTATIONS[draw % len(PERMUTATIONS)].tolist(), self.bag_size)
+    def bags(self, rs: Random_Source, k: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+        if out is None:
+            out = np.empty((k, self.bag_size), dtype=np.uint8)
+        packed = 0
+        while packed < k:
+            # take only as many draws as bags are missing, so no number is wasted
+            draws = rs.take((k - packed) * DIGITS_PER_DRAW).reshape(-1, DIGITS_PER_DRAW) @ DIGIT_WEIGHTS
+            draws = draws[draws < ACCEPTED_DRAWS]
+            out[packed:packed + len(draws)] = PERMUTATIONS[draws % len(PERMUTATIONS)]
+            packed += len(draws)
+        return out
+
+
+class No_Rules_Packer(Packer):
     """
        An indifferent packer which relays any number it gets from the generator
        without imposing any own rules.
     """
-    number = next(rs)
-    logger.debug(f"got {number}, yielding {number}")
-    yield deque([number], 1)
+    bag_size = 1
+    def bag(self, rs: Random_Source) -> deque:
+        return deque([next(rs)], 1)
+    def bags(self, rs: Random_Source, k: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+        if out is None:
+            out = np.empty((k, self.bag_size), dtype=np.uint8)
+        out[:, 0] = rs.take(k)
+        return out
 
 
 def seven_ones(rs: Random_Source):
@@ -96,81 +266,155 @@ def seven_ones(rs: Random_Source):
     maxlen = 7
     result = deque([], maxlen)
     while len(result) < result.maxlen:
-        to_check = next(rs)
-        if to_check == 1:
-            logger.debug(f"appending {to_check}")
-            result.append(to_check)
-        else:
-            logger.debug(f"discarding {to_check}")
-    logger.debug(f"returning full bag: {result}")
+        if next(rs) == 1:
+            result.append(1)
     yield result
 
 
-packer_dict = {"one_I_in_7": one_I_in_7,
+one_I_in_7_permutation = Permutation_Packer()
+no_rules = No_Rules_Packer()
+
+
+packer_dict = {"one_I_in_7": Function_Packer(one_I_in_7, 7),
+               "one_I_in_7_permutation": one_I_in_7_permutation,
                "no_rules": no_rules,
-               "seven_ones": seven_ones,
+               "seven_ones": Function_Packer(seven_ones, 7),
                }
 
 
+# The whole state of an Unpacker: the rest of the current bag, the next_queue
+# and the state of the random source, e.g. (seed, position) of a Block_Source
+Unpacker_State = namedtuple("Unpacker_State", "bag, bag_maxlen, next_queue, rs_state")
+
+
 class Unpacker():
-    def __init__(self, packer: Callable[[Random_Source], deque], rs: Random_Source) -> None:
+    def __init__(self, packer: Packer, rs: Random_Source) -> None:
         self.packer = packer
         self.rs = rs
         self.got_bag = deque([], 0)
-        logger.debug(f"initialized unpacker with {self.got_bag}")
+        logger.debug("initialized unpacker with %s", self.got_bag)
         self.next_queue = deque([], 7)
+        # the state of the random source and the tetrominoes of the bags peek packed from it
+        self.peeked: Tuple[Hashable, List[int]] = (None, [])
+    def snapshot(self) -> Unpacker_State:
+        """
+           Returns the contents of the current bag and the next_queue
+           and the state of the random source.
+           It is a few small tuples, so search bots can keep one per branch.
+        """
+        return Unpacker_State(tuple(self.got_bag), self.got_bag.maxlen, tuple(self.next_queue), self.rs.get_state())
+    def restore(self, state: Tuple) -> None:
+        """
+           Continues the stream from a snapshot, also from a plain tuple
+           as older replays hold them.
+        """
+        got_bag, maxlen, next_queue, rs_state = state
+        self.got_bag = deque(got_bag, maxlen)
+        self.next_queue = deque(next_queue, self.next_queue.maxlen)
+        self.rs.set_state(rs_state)
+    get_state = snapshot
+    set_state = restore
+    def peek(self, number: int) -> Tuple[int, ...]:
+        """
+           Returns the next number tetrominoes without advancing the stream.
+           Whole bags beyond the current one are packed at once, and only
+           the random source is rewound afterwards. They are kept until the
+           random source moves on, so peeking every frame packs nothing.
+        """
+        queued = len(self.next_queue)
+        if number <= queued:
+            return tuple(islice(self.next_queue, number))
+        result = list(self.next_queue)
+        result.extend(islice(self.got_bag, number - queued))
+        missing = number - len(result)
+        if missing > 0:
+            rs_state = self.rs.get_state()
+            peeked_state, peeked = self.peeked
+            if peeked_state != rs_state or len(peeked) < missing:
+                bags = self.packer.bags(self.rs, -(-missing // self.packer.bag_size))
+                self.rs.set_state(rs_state)
+                peeked = bags.ravel().tolist()
+                self.peeked = (rs_state, peeked)
+            result.extend(peeked[:missing])
+        return tuple(result)
     def request_next(self) -> None:
         """
            Requests next number from the random source and appends it
            to the next_queue
         """
         try:
-            logger.debug(f"Unpacker requesting next piece from current bag: {self.got_bag}")
             result = self.got_bag.popleft()
         except IndexError:
-            logger.debug("Unpacker requesting new bag")
-            self.got_bag = next(self.packer(self.rs))
-            logger.debug(f"got new bag: {self.got_bag}, popping left...")
+            self.got_bag = self.packer.bag(self.rs)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Unpacker got new bag: %s", self.got_bag)
             result = self.got_bag.popleft()
         self.next_queue.append(result)
-        logger.debug(f"Appended {result} to the next_queue: {self.next_queue}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Appended %s to the next_queue: %s", result, self.next_queue)
     def spawn_next(self):
         try:
-            logger.debug("Unpacker trying to spawn next piece...")
             result = self.next_queue.popleft()
-            logger.debug(f"Unpacker will spawn {result} soon...")
             self.request_next()
         except IndexError:
-            logger.debug("The next_queue seems to be empty. Requesting next piece...")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("The next_queue seems to be empty. Requesting next piece...")
             self.request_next()
             result = self.next_queue.popleft()
             self.request_next()
-        logger.debug(f"Unpacker spawning {result}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Unpacker spawning %s", result)
         return result
-    def preview_next(self, number: int) -> None:
-        logger.debug("Entered preview")
-        for i in range(number):
-            logger.debug(f"Trying to preview next {number} pieces")
-            try:
-                logger.debug(f"See what {self.next_queue} has at index {i}")
-                yield self.next_queue[i]
-            except IndexError:
-                logger.debug(f"Unpacker's Next Queue is not long enough")
-                for _ in range(number - len(self.next_queue)):
-                    self.request_next()
-                logger.debug(f"Unpacker's Next Queue is long enough to yield {self.next_queue[i]}")
-                yield self.next_queue[i]
-
-
-rs_dict = {"python9001": Random_Source(function=gen.generate),
-           "randint06": Random_Source(seed=9001, set_seed=random.seed, function=random.randint, args=(0, 6)),
-           "ones": Random_Source(function=ones.generate),
-           "primus": Random_Source(function=primus.generate),
-           }
+    def preview_next(self, number: int) -> Iterator[int]:
+        """
+           Yields the next number tetrominoes, see peek.
+        """
+        yield from self.peek(number)
+
+
+def randint06(seed: int) -> Random_Source:
+    """
+    A Random_Source drawing from its own random.Random instance.
+    """
+    own_random = random.Random()
+    return Random_Source(seed=seed,
+                         set_seed=own_random.seed,
+                         function=own_random.randint,
+                         args=(0, 6),
+                         get_state=own_random.getstate,
+                         set_state=own_random.setstate)
+
+
+def primus_source(seed: int) -> primus.Prime_Digits:
+    """
+    A primus stream of its own, starting at the seed-th prime.
+    """
+    source = primus.Prime_Digits()
+    if seed:
+        source.seek(seed)
+    return source
+
+
+# Factories of random sources, each creating a source with its own state,
+# so games never share a stream. They take the seed.
+rs_factories = {"python9001": lambda seed: randint06(9001),
+                "randint06": randint06,
+                "pcg64": Block_Source,
+                "ones": lambda seed: Random_Source(function=ones.generate, get_state=lambda: None, set_state=lambda state: None),
+                "primus": primus_source,
+                }
+
+
+def new_unpacker(packer_name: str, rs_name: str, seed: int) -> Unpacker:
+    """
+    Creates an Unpacker with a fresh random source, so that the same
+    names and seed always give the same stream of tetrominoes.
+    """
+    return Unpacker(packer_dict[packer_name], rs_factories[rs_name](seed))
 
 
 if __name__ == "__main__":
-    r = Unpacker(packer_dict["no_rules"], rs_dict["randint06"])
-    logger.debug(f"Preview next 7: {tuple(r.preview_next(7))}")
-    logger.debug(f"Spawning: {r.spawn_next()}")
-    logger.debug(f"Preview next 7: {tuple(r.preview_next(7))}")
+    r = new_unpacker("no_rules", "randint06", 9001)
+    logger.debug("Preview next 7: %s", tuple(r.preview_next(7)))
+    logger.debug("Spawning: %s", r.spawn_next())
+    logger.debug("Preview next 7: %s", tuple(r.preview_next(7)))
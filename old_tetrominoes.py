@@ -16,16 +16,21 @@
 #   The player can rotate the tetrominoes in 90° steps. Because of 
 
 import logging
-import logging.config
 import logging_conf
+import absolon
+import hashlib
+import numpy as np
 import pygame
 import time
 from collections import namedtuple
+from pathlib import Path
+from typing import Dict, Optional
 
 
 # Setup logging
-logging.config.dictConfig(logging_conf.dict_config)
-logger = logging.getLogger(__name__)
+logging_conf.configure()
+# named after the module, also when it runs as the script "__main__"
+logger = logging.getLogger("old_tetrominoes")
 
 
 class Mino():
@@ -41,18 +46,7 @@ class Mino():
         # self.row
     def rotate(self, rotation: int):
         # we rotate by n times 90°
-        if rotation == 0:
-            self.column = self.left
-            self.row = self.forward
-        elif rotation == 1:
-            self.column = self.forward
-            self.row = -self.left
-        elif rotation == 2:
-            self.column = -self.left
-            self.row = -self.forward
-        elif rotation == 3:
-            self.column = -self.forward
-            self.row = self.left
+        self.column, self.row = absolon.rotate_mino(self.forward, self.left, rotation)
     def __repr__(self):
         return f"Mino(col={self.column}, row={self.row})"
 
@@ -61,96 +55,171 @@ RGBafactors = namedtuple("RGBafactors", "r_factor, g_factor, b_factor, a_factor"
 Colorization = namedtuple("Colorization", "RGBafactors, intensity")
 
 
+COLOR_DICT = {"yellow":  Colorization(RGBafactors( 1,  1, -1,  0), 55),
+              "blue":    Colorization(RGBafactors(-1, -1,  1,  0), 55),
+              "magenta": Colorization(RGBafactors( 1, -1,  1,  0), 55),
+              "green":   Colorization(RGBafactors(-1,  1, -1,  0), 55),
+              "cyan":    Colorization(RGBafactors(-1,  1,  1,  0), 55),
+              "red":     Colorization(RGBafactors( 1, -1, -1,  0), 55),
+              "orange":  Colorization(RGBafactors( 1,  0, -1,  0), 55),
+              "gray":    Colorization(RGBafactors( 0,  0,  0,  0),  0),
+             }
+# Color of the garbage rows pushed up from the bottom
+GARBAGE_COLOR = "gray"
+
+
+PATTERN_FILE = Path("img/pattern.png")
+
+
+def colorize_array(rgba: np.ndarray, colorization: Colorization) -> np.ndarray:
+    """
+    Adds the colorization's intensity times its factor to each RGBa channel
+    of a (height, width, 4) image, keeping the channels in range [0, 255].
+    """
+    shift = np.asarray(colorization.RGBafactors, dtype=np.int16) * colorization.intensity
+    return np.clip(rgba.astype(np.int16) + shift, 0, 255).astype(np.uint8)
+
+
+class Sprite_Atlas():
+    """
+    The images of all colorizations of the pattern image, computed once.
+    If a cache folder is given, the colorized pixels are stored there under a key
+    made from the pattern image and the color table, and loaded on the next start.
+    Colorized pixels which are already at hand, e.g. from an asset bundle,
+    can be passed as arrays instead.
+    """
+    def __init__(self,
+                 pattern_file: Path = PATTERN_FILE,
+                 color_dict: Dict[str, Colorization] = COLOR_DICT,
+                 cache_folder: Optional[Path] = None,
+                 arrays: Optional[Dict[str, np.ndarray]] = None) -> None:
+        self.pattern_file = Path(pattern_file)
+        self.color_dict = color_dict
+        self.cache_folder = cache_folder
+        self.arrays = arrays
+        if self.arrays is None:
+            self.key = self.cache_key()
+            self.arrays = self.load_cache()
+        if self.arrays is None:
+            self.arrays = self.colorize_all()
+            self.save_cache()
+        self.sprites = {color: self.to_surface(rgba) for color, rgba in self.arrays.items()}
+    def __getitem__(self, color: str) -> pygame.Surface:
+        return self.sprites[color]
+    def cache_key(self) -> str:
+        digest = hashlib.sha256(self.pattern_file.read_bytes())
+        digest.update(repr(sorted(self.color_dict.items())).encode("utf-8"))
+        return digest.hexdigest()[:16]
+    def cache_file(self) -> Optional[Path]:
+        if self.cache_folder is None:
+            return None
+        return Path(self.cache_folder) / f"sprites_{self.key}.npz"
+    def colorize_all(self) -> Dict[str, np.ndarray]:
+        logger.debug("Colorizing %s", self.pattern_file)
+        pattern = pygame.image.load(str(self.pattern_file))
+        width, height = pattern.get_size()
+        rgba = np.frombuffer(pygame.image.tobytes(pattern, "RGBA"), dtype=np.uint8).reshape(height, width, 4)
+        return {color: colorize_array(rgba, colorization) for color, colorization in self.color_dict.items()}
+    def load_cache(self) -> Optional[Dict[str, np.ndarray]]:
+        cache_file = self.cache_file()
+        if cache_file is None or not cache_file.is_file():
+            return None
+        logger.debug("Loading sprites from %s", cache_file)
+        with np.load(cache_file) as cached:
+            arrays = {color: cached[color] for color in cached.files}
+        if set(arrays) != set(self.color_dict):
+            return None
+        return arrays
+    def save_cache(self) -> None:
+        cache_file = self.cache_file()
+        if cache_file is None:
+            return
+        logger.debug("Saving sprites to %s", cache_file)
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(cache_file, **self.arrays)
+    def to_surface(self, rgba: np.ndarray) -> pygame.Surface:
+        """
+        Turns a (height, width, 4) array into a surface, converted
+        to the pixel format of the display if there is one.
+        """
+        height, width, _ = rgba.shape
+        surface = pygame.image.frombuffer(rgba.tobytes(), (width, height), "RGBA")
+        if pygame.display.get_surface() is not None:
+            return surface.convert_alpha()
+        return surface.copy()
+
+
+sprite_atlas = None
+
+
+def load_sprite_atlas(pattern_file: Path = PATTERN_FILE, cache_folder: Optional[Path] = None) -> Sprite_Atlas:
+    """
+    Builds the sprite atlas all tetrominoes share.
+    Call it after the display mode is set, so the sprites get converted.
+    """
+    global sprite_atlas
+    sprite_atlas = Sprite_Atlas(pattern_file, COLOR_DICT, cache_folder)
+    return sprite_atlas
+
+
 class Tetromino():
     """
     A tetromino is a configuration of four adjacent minoes.
+    Its shape in every rotation is looked up in absolon.ROTATIONS.
     """
-    def __init__(self, mino_1: Mino, mino_2: Mino, mino_3: Mino) -> None:
-        self.mino_0 = Mino(0, 0)
-        self.mino_1 = mino_1
-        self.mino_2 = mino_2
-        self.mino_3 = mino_3
-        self.current_rotation = 0
-        self.rotate(self.current_rotation)
-        self.spawn_offset = 0
-        self.img = pygame.image.load("img/pattern.png")
-        self.color_dict = {"yellow":  Colorization(RGBafactors( 1,  1, -1,  0), 55),
-                           "blue":    Colorization(RGBafactors(-1, -1,  1,  0), 55),
-                           "magenta": Colorization(RGBafactors( 1, -1,  1,  0), 55),
-                           "green":   Colorization(RGBafactors(-1,  1, -1,  0), 55),
-                           "cyan":    Colorization(RGBafactors(-1,  1,  1,  0), 55),
-                           "red":     Colorization(RGBafactors( 1, -1, -1,  0), 55),
-                           "orange":  Colorization(RGBafactors( 1,  0, -1,  0), 55),
-                          }
+    piece = None
+    color = None
+    color_dict = COLOR_DICT
+    def __init__(self) -> None:
+        self.rotate(0)
+        self.spawn_offset = absolon.ROTATIONS[self.piece][0].spawn_offset
+        self.colorize(self.color)
     def __iter__(self):
-        return iter(tuple((self.mino_0, self.mino_1, self.mino_2, self.mino_3)))
+        return iter(self.cells)
     def __repr__(self):
-        return f"Tetromino({self.mino_0.column}, {self.mino_0.row}), {self.mino_1.column}, {self.mino_row}), {self.mino_2.column}, {self.mino_2.row}, {self.mino_3.column}, {self.mino_3.row})" 
+        return f"Tetromino({', '.join(f'{cell.column}, {cell.row}' for cell in self.cells)})"
     def rotate(self, n: int):
-        for mino in self:
-            mino.rotate(n)
+        self.cells = absolon.ROTATIONS[self.piece][n].cells
         self.current_rotation = n
     def colorize(self, color: str) -> None:
-        factors = self.color_dict[color].RGBafactors
-        intensity = self.color_dict[color].intensity
-        with pygame.PixelArray(self.img) as pxarray:
-            columns, rows = pxarray.shape
-            for row in range(rows):
-                for column in range(columns):
-                    # pxarray has four bytes per pixel representing RGBa in the order of aBGR
-                    # pygame.Color() expects the byte sequence RGBa. so we need to reverse the byte sequence
-                    pixel_int = pxarray[column, row] & 0xffffffff
-                    aRGB = pixel_int.to_bytes(4, byteorder="big")
-                    RGBa = int.from_bytes(aRGB, byteorder="little")
-                    pxcolor = pygame.Color(RGBa)
-                    values = tuple(max(min(255, channel + (intensity * factor)), 0) for channel, factor in zip(pxcolor, factors))
-                    new_color = pygame.Color(*values)
-                    pxarray[column, row] = new_color
+        if sprite_atlas is None:
+            load_sprite_atlas()
+        self.img = sprite_atlas[color]
 
 
 class Tetromino_I(Tetromino):
-    def __init__(self):
-        super().__init__(Mino(0, 1), Mino(0, 2), Mino(0, -1))
-        self.colorize("cyan")
+    piece = absolon.I
+    color = "cyan"
 
 
 class Tetromino_J(Tetromino):
-    def __init__(self):
-        super().__init__(Mino(0, 1), Mino(0, -1), Mino(1, 1))
-        self.colorize("blue")
-        self.spawn_offset = -1
+    piece = absolon.J
+    color = "blue"
 
 
 class Tetromino_L(Tetromino):
-    def __init__(self):
-        super().__init__(Mino(0, 1), Mino(0, -1), Mino(1, -1))
-        self.colorize("orange")
-        self.spawn_offset = -1
+    piece = absolon.L
+    color = "orange"
 
 
 class Tetromino_O(Tetromino):
-    def __init__(self):
-        super().__init__(Mino(0, 1), Mino(-1, 0), Mino(-1, 1))
-        self.colorize("yellow")
+    piece = absolon.O
+    color = "yellow"
 
 
 class Tetromino_S(Tetromino):
-    def __init__(self):
-        super().__init__(Mino(0, -1), Mino(-1, 0), Mino(-1, 1))
-        self.colorize("red")
+    piece = absolon.S
+    color = "red"
 
 
 class Tetromino_T(Tetromino):
-    def __init__(self):
-        super().__init__(Mino(0, 1), Mino(0, -1), Mino(1, 0))
-        self.colorize("magenta")
-        self.spawn_offset = -1
+    piece = absolon.T
+    color = "magenta"
 
 
 class Tetromino_Z(Tetromino):
-    def __init__(self):
-        super().__init__(Mino(0, 1), Mino(-1, 0), Mino(-1, -1))
-        self.colorize("green")
+    piece = absolon.Z
+    color = "green"
 
 
 mapping = {0: Tetromino_I,
@@ -0,0 +1,391 @@
+# This module records and replays games of absolon.
+#
+# A replay is a compact binary log of the inputs of a game (see the
+# inputs in absolon). It starts with a header naming the ruleset and
+# the generator of the game:
+#
+#   magic "ABSR", version 2         5 bytes
+#   rows, columns                   2 bytes
+#   spawn_row, spawn_column         2 bytes
+#   seed                            8 bytes, signed little endian
+#   ruleset, packer, random source  1 byte length + ASCII name each
+#
+# The header is followed by one record per input: the number of frames
+# since the previous input as a LEB128 varint and the input byte.
+# Most inputs take two bytes.
+#
+# A game-state recording also holds keyframes: every keyframe_interval
+# inputs a record with the input byte 255 is written, followed by the
+# length of a snapshot of the engine (4 bytes) and the snapshot itself:
+# counters, current tetromino, board, bag, next_queue and the state of
+# the random source. The bag and the next_queue are a length byte and a
+# byte per tetromino each. The state of the random source is a tag byte
+# followed by the fixed-size state of that kind of source:
+#
+#   RS_STATELESS    nothing, e.g. ones
+#   RS_BLOCK        seed and position of a Block_Source, 16 bytes
+#   RS_PRIMUS       position k of a Prime_Digits stream, 8 bytes
+#   RS_MERSENNE     the 625 words of a random.Random, 2500 bytes
+#
+# Keyframes hold nothing but these numbers, so reading a replay from an
+# untrusted source never runs code of it. The file then ends with a seek index, one
+# (frame, offset) pair of 8 bytes each per keyframe, the offset of the
+# index (8 bytes) and "ABSI". Seeking to a frame restores the last
+# keyframe before it and re-simulates at most keyframe_interval inputs.
+#
+# A replay is re-simulated by feeding its inputs to an absolon.Engine
+# whose Unpacker is created from the header. This needs neither SDL nor
+# pygame. render() plays a replay back through a Playfield instead.
+
+import bisect
+import mmap
+import struct
+import logging
+import logging_conf
+import numpy as np
+from collections import namedtuple
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+# own modules
+import absolon
+import old_generator as generator
+import generators.primus.primus as primus
+
+
+# Setup logging
+logging_conf.configure()
+# named after the module, also when it runs as the script "__main__"
+logger = logging.getLogger("replay")
+
+
+MAGIC = b"ABSR"
+VERSION = 2
+RULESET = "absolon"
+SUFFIX = ".absr"
+HEADER_STRUCT = struct.Struct("<4sBBBBBq")
+INPUT_KEYFRAME = 255
+KEYFRAME_STRUCT = struct.Struct("<IIIBB")
+BAG_STRUCT = struct.Struct("<BB")
+RS_STATELESS = 0
+RS_BLOCK = 1
+RS_PRIMUS = 2
+RS_MERSENNE = 3
+BLOCK_STATE_STRUCT = struct.Struct("<qQ")
+PRIMUS_STATE_STRUCT = struct.Struct("<Q")
+MERSENNE_STATE_STRUCT = struct.Struct("<625I")
+# the version of the state random.Random.getstate returns
+MERSENNE_VERSION = 3
+LENGTH_STRUCT = struct.Struct("<I")
+INDEX_ENTRY_STRUCT = struct.Struct("<QQ")
+INDEX_MAGIC = b"ABSI"
+FOOTER_STRUCT = struct.Struct("<Q4s")
+
+Replay_Header = namedtuple("Replay_Header", "ruleset, packer_name, rs_name, seed, rows, columns, spawn_row, spawn_column")
+
+
+def encode_header(header: Replay_Header) -> bytes:
+    fixed = HEADER_STRUCT.pack(MAGIC, VERSION, header.rows, header.columns,
+                               header.spawn_row, header.spawn_column, header.seed)
+    names = b"".join(bytes([len(name)]) + name.encode("ascii")
+                     for name in (header.ruleset, header.packer_name, header.rs_name))
+    return fixed + names
+
+
+def decode_header(data) -> Tuple[Replay_Header, int]:
+    """
+    Returns the header and the offset of the first record.
+    """
+    magic, version, rows, columns, spawn_row, spawn_column, seed = HEADER_STRUCT.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not an absolon replay")
+    if version != VERSION:
+        raise ValueError(f"Unsupported replay version {version}")
+    offset = HEADER_STRUCT.size
+    names = []
+    for _ in range(3):
+        length = data[offset]
+        names.append(bytes(data[offset + 1:offset + 1 + length]).decode("ascii"))
+        offset += 1 + length
+    ruleset, packer_name, rs_name = names
+    return Replay_Header(ruleset, packer_name, rs_name, seed, rows, columns, spawn_row, spawn_column), offset
+
+
+def encode_varint(number: int) -> bytes:
+    result = bytearray()
+    while number >= 0x80:
+        result.append(number & 0x7f | 0x80)
+        number >>= 7
+    result.append(number)
+    return bytes(result)
+
+
+def encode_rs_state(rs) -> bytes:
+    """
+    Returns the tag and the state of a random source, see the top of the module.
+    """
+    state = rs.get_state()
+    if state is None:
+        return bytes([RS_STATELESS])
+    if isinstance(rs, generator.Block_Source):
+        return bytes([RS_BLOCK]) + BLOCK_STATE_STRUCT.pack(*state)
+    if isinstance(rs, primus.Prime_Digits):
+        return bytes([RS_PRIMUS]) + PRIMUS_STATE_STRUCT.pack(state)
+    if isinstance(state, tuple) and len(state) == 3 and state[0] == MERSENNE_VERSION and state[2] is None:
+        return bytes([RS_MERSENNE]) + MERSENNE_STATE_STRUCT.pack(*state[1])
+    raise ValueError(f"Cannot encode the state of {rs!r}")
+
+
+def decode_rs_state(data, offset: int) -> Tuple[object, int]:
+    """
+    Returns the state of a random source and the offset after it.
+    """
+    tag = data[offset]
+    offset += 1
+    if tag == RS_STATELESS:
+        return None, offset
+    if tag == RS_BLOCK:
+        return BLOCK_STATE_STRUCT.unpack_from(data, offset), offset + BLOCK_STATE_STRUCT.size
+    if tag == RS_PRIMUS:
+        return PRIMUS_STATE_STRUCT.unpack_from(data, offset)[0], offset + PRIMUS_STATE_STRUCT.size
+    if tag == RS_MERSENNE:
+        return (MERSENNE_VERSION, MERSENNE_STATE_STRUCT.unpack_from(data, offset), None), offset + MERSENNE_STATE_STRUCT.size
+    raise ValueError(f"Unknown random source tag {tag}")
+
+
+def encode_keyframe(engine: absolon.Engine) -> bytes:
+    """
+    Returns a snapshot of the engine.
+    """
+    counters = KEYFRAME_STRUCT.pack(engine.pieces, engine.lines, engine.board.rows * engine.board.columns,
+                                    engine.piece, engine.topped_out)
+    state = engine.unpacker.snapshot()
+    return b"".join((counters,
+                     engine.board.grid.tobytes(),
+                     BAG_STRUCT.pack(state.bag_maxlen, len(state.bag)), bytes(state.bag),
+                     bytes([len(state.next_queue)]), bytes(state.next_queue),
+                     encode_rs_state(engine.unpacker.rs)))
+
+
+def decode_keyframe(data, engine: absolon.Engine) -> None:
+    """
+    Restores the engine to a snapshot.
+    """
+    engine.pieces, engine.lines, cells, engine.piece, topped_out = KEYFRAME_STRUCT.unpack_from(data, 0)
+    engine.topped_out = bool(topped_out)
+    offset = KEYFRAME_STRUCT.size
+    engine.board.grid[:] = np.frombuffer(data, dtype=np.uint8, count=cells, offset=offset).reshape(engine.board.grid.shape)
+    engine.board.recount()
+    offset += cells
+    bag_maxlen, length = BAG_STRUCT.unpack_from(data, offset)
+    offset += BAG_STRUCT.size
+    bag = tuple(data[offset:offset + length])
+    offset += length
+    length = data[offset]
+    next_queue = tuple(data[offset + 1:offset + 1 + length])
+    rs_state, _ = decode_rs_state(data, offset + 1 + length)
+    engine.unpacker.restore(generator.Unpacker_State(bag, bag_maxlen, next_queue, rs_state))
+
+
+class Recorder():
+    """
+    Writes the inputs of a game into a replay file.
+    Given the engine of the game and a keyframe_interval,
+    it also writes keyframes and a seek index.
+    """
+    def __init__(self,
+                 path: Path,
+                 header: Replay_Header,
+                 engine: Optional[absolon.Engine] = None,
+                 keyframe_interval: int = 0) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.header = header
+        self.engine = engine
+        self.keyframe_interval = keyframe_interval if engine is not None else 0
+        self.file: BinaryIO = open(self.path, mode="wb")
+        self.file.write(encode_header(header))
+        self.last_frame = 0
+        self.inputs = 0
+        self.index: List[Tuple[int, int]] = []
+        logger.debug("Recording replay into %s", self.path)
+    def record(self, frame: int, code: int) -> None:
+        """
+        Records an input which has just been applied to the game.
+        """
+        self.file.write(encode_varint(frame - self.last_frame) + bytes([code]))
+        self.last_frame = frame
+        self.inputs += 1
+        if self.keyframe_interval and self.inputs % self.keyframe_interval == 0:
+            self.keyframe(frame)
+    def keyframe(self, frame: int) -> None:
+        snapshot = encode_keyframe(self.engine)
+        self.index.append((frame, self.file.tell()))
+        self.file.write(encode_varint(frame - self.last_frame) + bytes([INPUT_KEYFRAME]))
+        self.file.write(LENGTH_STRUCT.pack(len(snapshot)) + snapshot)
+        self.last_frame = frame
+    def close(self) -> None:
+        if not self.file.closed:
+            if self.index:
+                index_offset = self.file.tell()
+                self.file.write(b"".join(INDEX_ENTRY_STRUCT.pack(*entry) for entry in self.index))
+                self.file.write(FOOTER_STRUCT.pack(index_offset, INDEX_MAGIC))
+            self.file.close()
+            logger.debug("Recorded %d inputs and %d keyframes into %s", self.inputs, len(self.index), self.path)
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+
+
+class Replay():
+    """
+    A memory-mapped replay file.
+    """
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        with open(self.path, mode="rb") as replay_file:
+            self.data = mmap.mmap(replay_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header, self.records_offset = decode_header(self.data)
+        self.records_end = len(self.data)
+        self.index: List[Tuple[int, int]] = []
+        if len(self.data) >= self.records_offset + FOOTER_STRUCT.size:
+            index_offset, magic = FOOTER_STRUCT.unpack_from(self.data, len(self.data) - FOOTER_STRUCT.size)
+            if magic == INDEX_MAGIC:
+                self.records_end = index_offset
+                self.index = [INDEX_ENTRY_STRUCT.unpack_from(self.data, offset)
+                              for offset in range(index_offset, len(self.data) - FOOTER_STRUCT.size, INDEX_ENTRY_STRUCT.size)]
+        self.index_frames = [frame for frame, _ in self.index]
+    def close(self) -> None:
+        self.data.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+    def read(self, offset: int, frame: int = 0) -> Iterator[Tuple[int, int, int]]:
+        """
+        Yields the (frame, input, offset) of the records from offset on.
+        For keyframes, offset is where their snapshot starts.
+        frame is the frame of the record before offset.
+        """
+        data = self.data
+        end = self.records_end
+        while offset < end:
+            delta = 0
+            shift = 0
+            while True:
+                byte = data[offset]
+                offset += 1
+                delta |= (byte & 0x7f) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            frame += delta
+            code = data[offset]
+            offset += 1
+            yield frame, code, offset
+            if code == INPUT_KEYFRAME:
+                offset += LENGTH_STRUCT.size + LENGTH_STRUCT.unpack_from(data, offset)[0]
+    def records(self, offset: Optional[int] = None, frame: int = 0) -> Iterator[Tuple[int, int]]:
+        """
+        Yields the (frame, input) records of the replay, skipping keyframes.
+        """
+        if offset is None:
+            offset = self.records_offset
+        for frame, code, _ in self.read(offset, frame):
+            if code != INPUT_KEYFRAME:
+                yield frame, code
+    def engine(self, board: Optional[absolon.Board] = None) -> absolon.Engine:
+        """
+        Creates the engine the recorded game started with.
+        """
+        header = self.header
+        unpacker = generator.new_unpacker(header.packer_name, header.rs_name, header.seed)
+        return absolon.Engine(unpacker, header.rows, header.columns, header.spawn_row, header.spawn_column, board)
+    def seek(self, frame: int, engine: Optional[absolon.Engine] = None) -> absolon.Engine:
+        """
+        Returns an engine in the state of the game at the end of the given frame.
+        An engine created by Replay.engine() can be passed to be reused,
+        it is only replaced when seeking before the first keyframe.
+        """
+        keyframe = bisect.bisect_right(self.index_frames, frame) - 1
+        if keyframe < 0:
+            # no keyframe before the frame, start from the beginning
+            board = None
+            if engine is not None:
+                board = engine.board
+                board.clear()
+            engine = self.engine(board)
+            offset, start = self.records_offset, 0
+        else:
+            if engine is None:
+                engine = self.engine()
+            start, record_offset = self.index[keyframe]
+            _, _, offset = next(self.read(record_offset))
+            length = LENGTH_STRUCT.unpack_from(self.data, offset)[0]
+            offset += LENGTH_STRUCT.size
+            decode_keyframe(self.data[offset:offset + length], engine)
+            offset += length
+        for record_frame, code in self.records(offset, start):
+            if record_frame > frame:
+                break
+            engine.apply(code)
+        return engine
+
+
+def simulate(replay: Replay) -> absolon.Engine:
+    """
+    Re-simulates a replay headless, as fast as possible,
+    and returns the engine in its final state.
+    """
+    engine = replay.engine()
+    apply = engine.apply
+    for _, code in replay.records():
+        apply(code)
+    return engine
+
+
+def render(replay: Replay, game, speed: float = 1.0) -> absolon.Engine:
+    """
+    Plays a replay back through the Playfield of an absolutris.Game
+    whose window is set up. speed multiplies the recorded frame rate.
+    """
+    import pygame
+    game.pf.board.clear()
+    engine = replay.engine(game.pf.board)
+    records = replay.records()
+    record = next(records, None)
+    frame = 0.0
+    while record is not None:
+        frame += speed
+        while record is not None and record[0] <= frame:
+            engine.apply(record[1])
+            record = next(records, None)
+        game.pf.sync()
+        pygame.display.update(game.list_of_rectangles_to_update.coalesce(game.rect_budget))
+        game.list_of_rectangles_to_update.clear()
+        game.clock.tick(game.framerate)
+        if pygame.event.peek(pygame.QUIT):
+            break
+    return engine
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Re-simulate or play back absolon replays")
+    parser.add_argument("replays", nargs="+", type=Path)
+    parser.add_argument("--render", action="store_true", help="play back in the absolutris window")
+    parser.add_argument("--speed", type=float, default=1.0, help="speed multiplier for --render")
+    arguments = parser.parse_args()
+    if arguments.render:
+        import absolutris
+        game = absolutris.Game(Path("config.ini"))
+        game.setup()
+        for path in arguments.replays:
+            with Replay(path) as replay:
+                render(replay, game, arguments.speed)
+        game.quit()
+    else:
+        for path in arguments.replays:
+            with Replay(path) as replay:
+                engine = simulate(replay)
+            print(f"{path}: {engine.pieces} pieces, {engine.lines} lines, board:\n{engine.board}")
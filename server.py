@@ -0,0 +1,333 @@
+# This module runs 1v1 matches of absolon on an asyncio server.
+#
+# Every match is simulated headless by one absolon.Engine per player.
+# Both engines get an Unpacker created from the same names and seed, so
+# both players receive the same stream of tetrominoes.
+#
+# The server advances all matches in lockstep with a fixed tick rate.
+# Clients send their inputs stamped with the tick they are meant for;
+# an input is applied on its tick, or on the current tick if it arrives
+# late. After each tick every client gets one message with all inputs
+# of its match applied in that tick, so the clients can re-simulate the
+# match themselves. Ticks without inputs are not sent. Clients may only
+# send placements, see absolon.place_input, any other input disconnects
+# them.
+#
+# The protocol is one JSON object per line:
+#   client -> server  {"join": "<match name>"}
+#                     {"tick": 12, "input": 35}
+#   server -> client  {"start": "<match name>", "player": 0, "seed": 3, "packer": ..., "random_source": ...}
+#                     {"tick": 12, "inputs": [[0, 35], [1, 18]]}
+#                     {"over": "<match name>", "tick": 80, "winner": 1}
+
+import asyncio
+import itertools
+import json
+import random
+import time
+import logging
+import logging_conf
+import numpy as np
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+# own modules
+import absolon
+import old_generator as generator
+
+
+# Setup logging
+logging_conf.configure()
+# named after the module, also when it runs as the script "__main__"
+logger = logging.getLogger("server")
+
+
+# Clients whose unsent output grows beyond this are disconnected
+WRITE_BUFFER_LIMIT = 1 << 20
+# Clients with more inputs waiting for their tick than this are disconnected
+INPUT_LIMIT = 1024
+
+
+class Player():
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        self.match: Optional["Match"] = None
+        self.index = 0
+        self.engine: Optional[absolon.Engine] = None
+        self.inputs: Deque[Tuple[int, int]] = deque()
+    def send(self, message: bytes) -> None:
+        transport = self.writer.transport
+        if transport.is_closing():
+            return
+        if transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+            logger.warning("Disconnecting a client which does not read its updates")
+            transport.close()
+            return
+        self.writer.write(message)
+
+
+class Match():
+    """
+    Two players whose engines are fed the same stream of tetrominoes.
+    """
+    def __init__(self, name: str, seed: int, packer_name: str, rs_name: str) -> None:
+        self.name = name
+        # the key of the match on its server
+        self.number = 0
+        self.seed = seed
+        self.packer_name = packer_name
+        self.rs_name = rs_name
+        self.players: List[Player] = []
+        self.tick = 0
+        self.running = False
+        self.over = False
+    def join(self, player: Player) -> None:
+        player.match = self
+        player.index = len(self.players)
+        player.engine = absolon.Engine(generator.new_unpacker(self.packer_name, self.rs_name, self.seed))
+        self.players.append(player)
+    def leave(self, player: Player) -> None:
+        """
+        Removes a player from a match which has not started.
+        """
+        self.players.remove(player)
+        for index, other in enumerate(self.players):
+            other.index = index
+        player.match = None
+    def start(self) -> None:
+        self.running = True
+        for player in self.players:
+            player.send(encode({"start": self.name,
+                                "player": player.index,
+                                "seed": self.seed,
+                                "packer": self.packer_name,
+                                "random_source": self.rs_name}))
+    def advance(self) -> None:
+        """
+        Applies the inputs due in this tick and sends them to both players at once.
+        """
+        applied = []
+        for player in self.players:
+            while player.inputs and player.inputs[0][0] <= self.tick:
+                _, code = player.inputs.popleft()
+                player.engine.apply(code)
+                applied.append((player.index, code))
+        if applied:
+            message = encode({"tick": self.tick, "inputs": applied})
+            for player in self.players:
+                player.send(message)
+        topped_out = [player.engine.topped_out for player in self.players]
+        if any(topped_out):
+            self.finish(winner=topped_out.index(False) if not all(topped_out) else None)
+        self.tick += 1
+    def finish(self, winner: Optional[int]) -> None:
+        self.running = False
+        self.over = True
+        message = encode({"over": self.name, "tick": self.tick, "winner": winner})
+        for player in self.players:
+            player.send(message)
+        logger.debug("Match %s is over after %d ticks, winner %s", self.name, self.tick, winner)
+
+
+def encode(message: dict) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class Match_Server():
+    """
+    Hosts many matches in one process and advances them in lockstep.
+    """
+    def __init__(self,
+                 tick_rate: int = 60,
+                 packer_name: str = "one_I_in_7_permutation",
+                 rs_name: str = "pcg64",
+                 seed: Optional[int] = None) -> None:
+        self.tick_rate = tick_rate
+        self.packer_name = packer_name
+        self.rs_name = rs_name
+        self.seeds = random.Random(seed)
+        # all matches by a number of their own, as later matches may reuse the name
+        self.matches: Dict[int, Match] = {}
+        # the matches waiting for their second player by name
+        self.waiting: Dict[str, Match] = {}
+        self.match_numbers = itertools.count()
+        self.servers: List[asyncio.AbstractServer] = []
+        self.handlers: Dict[asyncio.Task, Player] = {}
+        self.ticks = 0
+        self.late_ticks = 0
+    async def start_tcp(self, host: str = "127.0.0.1", port: int = 0) -> asyncio.AbstractServer:
+        server = await asyncio.start_server(self.handle_client, host, port)
+        self.servers.append(server)
+        return server
+    async def start_unix(self, path: str) -> asyncio.AbstractServer:
+        server = await asyncio.start_unix_server(self.handle_client, path)
+        self.servers.append(server)
+        return server
+    def join(self, player: Player, name: str) -> None:
+        match = self.waiting.get(name)
+        if match is None:
+            match = Match(name, self.seeds.getrandbits(63), self.packer_name, self.rs_name)
+            match.number = next(self.match_numbers)
+            self.matches[match.number] = match
+            self.waiting[name] = match
+        match.join(player)
+        if len(match.players) == 2:
+            del self.waiting[name]
+            match.start()
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        player = Player(writer)
+        handler = asyncio.current_task()
+        self.handlers[handler] = player
+        try:
+            async for line in reader:
+                message = json.loads(line)
+                if "input" in message:
+                    code = message["input"]
+                    # clients may only place, drawing, spawning and clearing are up to the server
+                    if not isinstance(code, int) or isinstance(code, bool) or not absolon.INPUT_PLACE <= code < absolon.INPUT_DRAW:
+                        raise ValueError(f"Invalid input {code!r}")
+                    if player.match is not None and not player.match.over:
+                        if len(player.inputs) >= INPUT_LIMIT:
+                            raise ValueError(f"More than {INPUT_LIMIT} inputs are waiting")
+                        player.inputs.append((int(message["tick"]), code))
+                elif "join" in message and player.match is None:
+                    self.join(player, str(message["join"]))
+        except (ConnectionError, ValueError, KeyError, TypeError) as err:
+            logger.debug("Client disconnected: %s", err)
+        finally:
+            match = player.match
+            if match is not None and match.running:
+                match.finish(winner=1 - player.index if len(match.players) == 2 else None)
+            elif match is not None and not match.over:
+                match.leave(player)
+                if not match.players:
+                    del self.waiting[match.name]
+                    del self.matches[match.number]
+            writer.close()
+            del self.handlers[handler]
+    def advance(self) -> None:
+        """
+        Advances every running match by one tick and forgets finished ones.
+        """
+        for number, match in list(self.matches.items()):
+            if match.running:
+                match.advance()
+            if match.over:
+                del self.matches[number]
+        self.ticks += 1
+    async def run(self, duration: Optional[float] = None) -> None:
+        """
+        Ticks all matches with the fixed tick rate, for duration seconds or forever.
+        """
+        period = 1 / self.tick_rate
+        start = time.perf_counter()
+        for tick in itertools.count():
+            self.advance()
+            due = start + (tick + 1) * period
+            if duration is not None and due - start >= duration:
+                break
+            delay = due - time.perf_counter()
+            if delay < 0:
+                self.late_ticks += 1
+            await asyncio.sleep(max(delay, 0))
+    async def close(self) -> None:
+        """
+        Stops listening and disconnects all clients.
+        """
+        for server in self.servers:
+            server.close()
+        for player in self.handlers.values():
+            player.writer.close()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+
+
+async def scripted_client(connection: asyncio.Future, match: str, inputs_per_second: float = 4.0, seed: int = 0) -> Tuple[dict, List[absolon.Engine]]:
+    """
+    A local test client. It joins a match and places tetrominoes on random
+    absolute positions until the match is over, re-simulating both players
+    from the relayed inputs. Returns the last message and the two engines.
+    connection is the awaitable of asyncio.open_connection or open_unix_connection.
+    """
+    reader, writer = await connection
+    rng = random.Random(seed)
+    writer.write(encode({"join": match}))
+    start = json.loads(await reader.readline())
+    engines = [absolon.Engine(generator.new_unpacker(start["packer"], start["random_source"], start["seed"]))
+               for _ in range(2)]
+    own = engines[start["player"]]
+    tick = 0
+    last = start
+    async def play() -> None:
+        while True:
+            await asyncio.sleep(rng.expovariate(inputs_per_second))
+            rotation = rng.randrange(4)
+            column = rng.randrange(own.board.columns - absolon.WIDTHS[own.piece, rotation] + 1)
+            writer.write(encode({"tick": tick + 1, "input": absolon.place_input(rotation, column)}))
+    player = asyncio.ensure_future(play())
+    try:
+        async for line in reader:
+            last = json.loads(line)
+            if "over" in last:
+                break
+            tick = last["tick"]
+            for index, code in last["inputs"]:
+                engines[index].apply(code)
+    finally:
+        player.cancel()
+        writer.close()
+    return last, engines
+
+
+async def load_test(matches: int, duration: float, tick_rate: int, path: str) -> Tuple[Match_Server, int, int]:
+    """
+    Runs matches of scripted clients over a unix socket for duration seconds.
+    Returns the server, the number of finished matches and the number of
+    finished matches whose two clients disagree about the boards.
+    """
+    server = Match_Server(tick_rate=tick_rate, seed=0)
+    await server.start_unix(path)
+    runner = asyncio.ensure_future(server.run(duration))
+    clients = [asyncio.ensure_future(scripted_client(asyncio.open_unix_connection(path), f"match {number}", seed=seat))
+               for number in range(matches) for seat in (2 * number, 2 * number + 1)]
+    await runner
+    await server.close()
+    Path(path).unlink()
+    finished = 0
+    desynced = 0
+    for first, second in zip(clients[::2], clients[1::2]):
+        if first.done() and second.done() and not first.exception() and not second.exception():
+            finished += 1
+            (_, first_engines), (_, second_engines) = first.result(), second.result()
+            if any(not np.array_equal(a.board.grid, b.board.grid) for a, b in zip(first_engines, second_engines)):
+                desynced += 1
+    for client in clients:
+        client.cancel()
+    await asyncio.gather(*clients, return_exceptions=True)
+    return server, finished, desynced
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the absolon match server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--unix", help="listen on this unix socket instead of TCP")
+    parser.add_argument("--tick-rate", type=int, default=60)
+    parser.add_argument("--load-test", type=int, metavar="MATCHES",
+                        help="run this many matches of scripted clients over a unix socket and report the timing")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of the load test")
+    arguments = parser.parse_args()
+    if arguments.load_test:
+        logging_conf.set_subsystem_levels({"engine": "WARNING", "generator": "WARNING"})
+        server, finished, desynced = asyncio.run(load_test(arguments.load_test, arguments.duration, arguments.tick_rate,
+                                                           arguments.unix or "absolon-load-test.sock"))
+        print(f"{server.ticks} ticks, {server.late_ticks} late, {finished} matches finished, {desynced} desynced")
+    else:
+        async def serve() -> None:
+            server = Match_Server(tick_rate=arguments.tick_rate)
+            if arguments.unix:
+                await server.start_unix(arguments.unix)
+            else:
+                await server.start_tcp(arguments.host, arguments.port)
+            await server.run()
+        asyncio.run(serve())
@@ -0,0 +1,261 @@
+# This module shares the tetromino sequence of a match between processes.
+#
+# A Sequence_Producer draws the tetrominoes from one Unpacker and writes
+# them into a ring buffer in multiprocessing.shared_memory. Every player
+# process of the match reads the buffer through a Sequence_Consumer with
+# a cursor of its own, so the sequence is generated once and every player
+# gets exactly the same tetrominoes. A Sequence_Consumer can stand in for
+# the Unpacker of an absolon.Engine.
+#
+# Layout of the shared memory, int64 header followed by the pieces:
+#
+#   write       number of pieces written so far
+#   capacity    number of slots of the ring
+#   consumers   number of cursors
+#   closed      1 once the producer has stopped
+#   cursors     number of pieces read so far, one per consumer
+#   pieces      capacity uint8 slots, piece n is in slot n % capacity
+#
+# The producer writes the pieces first and then publishes them by storing
+# the new write index, one aligned 8 byte store, so a consumer never sees
+# an index ahead of the pieces or half of an index. The producer never
+# writes more than capacity pieces ahead of the slowest cursor, so no
+# slot is overwritten before every consumer has read it.
+#
+# Consumers which run low set the refill event, a multiprocessing.Event
+# the producer waits on in serve(). The event has to be shared with the
+# consumer processes when they are started.
+
+import time
+import logging
+import logging_conf
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Iterator, Optional, Tuple
+# own modules
+import old_generator as generator
+
+
+# Setup logging
+logging_conf.configure()
+# named after the module, also when it runs as the script "__main__"
+logger = logging.getLogger("shared_sequence")
+
+
+WRITE, CAPACITY, CONSUMERS, CLOSED = range(4)
+HEADER_FIELDS = 4
+
+
+def header_view(shm: shared_memory.SharedMemory, consumers: int) -> np.ndarray:
+    return np.ndarray((HEADER_FIELDS + consumers,), dtype=np.int64, buffer=shm.buf)
+
+
+def pieces_view(shm: shared_memory.SharedMemory, capacity: int, consumers: int) -> np.ndarray:
+    return np.ndarray((capacity,), dtype=np.uint8, buffer=shm.buf, offset=(HEADER_FIELDS + consumers) * 8)
+
+
+class Sequence_Producer():
+    """
+    Writes the tetrominoes of an Unpacker into a shared ring buffer.
+    """
+    def __init__(self,
+                 unpacker: generator.Unpacker,
+                 consumers: int = 1,
+                 capacity: int = 4096,
+                 name: Optional[str] = None,
+                 refill=None) -> None:
+        self.unpacker = unpacker
+        self.capacity = capacity
+        self.consumers = consumers
+        self.refill = refill
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=(HEADER_FIELDS + consumers) * 8 + capacity)
+        self.header = header_view(self.shm, consumers)
+        self.pieces = pieces_view(self.shm, capacity, consumers)
+        self.header[:] = 0
+        self.header[CAPACITY] = capacity
+        self.header[CONSUMERS] = consumers
+        self.fill()
+        logger.debug("Sharing the sequence in %s with %d slots for %d consumers", self.name, capacity, consumers)
+    @property
+    def name(self) -> str:
+        return self.shm.name
+    def fill(self) -> int:
+        """
+        Writes as many pieces as the slowest consumer leaves room for
+        and returns their number.
+        """
+        write = int(self.header[WRITE])
+        free = self.capacity - (write - int(self.header[HEADER_FIELDS:].min()))
+        if free <= 0:
+            return 0
+        pieces = [self.unpacker.spawn_next() for _ in range(free)]
+        start = write % self.capacity
+        first = min(free, self.capacity - start)
+        self.pieces[start:start + first] = pieces[:first]
+        self.pieces[:free - first] = pieces[first:]
+        # publish after the pieces are in place
+        self.header[WRITE] = write + free
+        return free
+    def serve(self, stop, timeout: float = 0.05) -> None:
+        """
+        Refills the buffer whenever a consumer asks for it until
+        the stop event is set.
+        """
+        while not stop.is_set():
+            if self.refill is not None:
+                self.refill.wait(timeout)
+                self.refill.clear()
+            else:
+                time.sleep(timeout)
+            self.fill()
+    def close(self) -> None:
+        """
+        Tells the consumers that no more pieces will come and frees the buffer.
+        """
+        self.header[CLOSED] = 1
+        del self.header, self.pieces
+        self.shm.close()
+        self.shm.unlink()
+
+
+class Sequence_Consumer():
+    """
+    Reads the tetrominoes of a shared ring buffer through its own cursor.
+    Has the spawn_next, preview_next, peek, snapshot and restore of an Unpacker.
+    """
+    def __init__(self,
+                 name: str,
+                 slot: int,
+                 refill=None,
+                 low_water: Optional[int] = None,
+                 poll: float = 0.0005) -> None:
+        self.shm = shared_memory.SharedMemory(name=name)
+        fields = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=self.shm.buf)
+        self.capacity = int(fields[CAPACITY])
+        consumers = int(fields[CONSUMERS])
+        del fields
+        if not 0 <= slot < consumers:
+            raise ValueError(f"Slot {slot} out of range for {consumers} consumers")
+        self.slot = HEADER_FIELDS + slot
+        self.header = header_view(self.shm, consumers)
+        self.pieces = pieces_view(self.shm, self.capacity, consumers)
+        self.refill = refill
+        self.low_water = self.capacity // 2 if low_water is None else low_water
+        self.poll = poll
+        self.cursor = int(self.header[self.slot])
+    def available(self) -> int:
+        return int(self.header[WRITE]) - self.cursor
+    def wait(self, number: int) -> None:
+        """
+        Waits until number pieces can be read.
+        """
+        if number > self.capacity:
+            raise ValueError(f"Cannot wait for {number} pieces in a ring of {self.capacity}")
+        available = self.available()
+        if available <= self.low_water and self.refill is not None:
+            self.refill.set()
+        while available < number:
+            if self.header[CLOSED]:
+                raise EOFError("The producer has closed the sequence")
+            time.sleep(self.poll)
+            available = self.available()
+    def advance(self, number: int) -> None:
+        self.cursor += number
+        self.header[self.slot] = self.cursor
+    def spawn_next(self) -> int:
+        self.wait(1)
+        piece = int(self.pieces[self.cursor % self.capacity])
+        self.advance(1)
+        return piece
+    def preview_next(self, number: int) -> Iterator[int]:
+        self.wait(number)
+        for i in range(number):
+            yield int(self.pieces[(self.cursor + i) % self.capacity])
+    def peek(self, number: int) -> Tuple[int, ...]:
+        return tuple(self.preview_next(number))
+    def take(self, number: int) -> np.ndarray:
+        """
+        Returns the next number pieces as an array of their own. They are
+        copied before the cursor moves on, as the producer may refill
+        their slots as soon as it does.
+        """
+        self.wait(number)
+        start = self.cursor % self.capacity
+        if start + number <= self.capacity:
+            result = self.pieces[start:start + number].copy()
+        else:
+            result = np.concatenate((self.pieces[start:], self.pieces[:start + number - self.capacity]))
+        self.advance(number)
+        return result
+    def get_state(self) -> int:
+        return self.cursor
+    def set_state(self, cursor: int) -> None:
+        """
+        Moves the cursor, back no further than the pieces still in the ring.
+        """
+        if int(self.header[WRITE]) - cursor > self.capacity:
+            raise ValueError(f"Piece {cursor} has already been overwritten")
+        self.cursor = cursor
+        self.header[self.slot] = cursor
+    snapshot = get_state
+    restore = set_state
+    def close(self) -> None:
+        del self.header, self.pieces
+        self.shm.close()
+
+
+def play(name: str, slot: int, refill, placements: int, seed: int, results) -> None:
+    """
+    A player process for the demonstration below. It places the pieces
+    on random columns and puts the pieces it got into the results queue.
+    """
+    import random
+    import absolon
+    consumer = Sequence_Consumer(name, slot, refill)
+    engine = absolon.Engine(consumer)
+    rng = random.Random(seed)
+    pieces = [engine.piece]
+    while len(pieces) <= placements:
+        if engine.topped_out:
+            engine.board.clear()
+            engine.topped_out = False
+        rotation = rng.randrange(4)
+        if engine.step(rotation, rng.randrange(engine.board.columns - absolon.WIDTHS[engine.piece, rotation] + 1)):
+            pieces.append(engine.piece)
+    consumer.close()
+    results.put((slot, pieces))
+
+
+if __name__ == "__main__":
+    import argparse
+    import multiprocessing
+    import threading
+    parser = argparse.ArgumentParser(description="Share the sequence of one match between player processes")
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--placements", type=int, default=20000)
+    parser.add_argument("--packer", default="one_I_in_7_permutation")
+    parser.add_argument("--random-source", default="pcg64")
+    parser.add_argument("--seed", type=int, default=9001)
+    arguments = parser.parse_args()
+    logging_conf.set_subsystem_levels({"engine": "WARNING", "generator": "WARNING"})
+    refill = multiprocessing.Event()
+    stop = threading.Event()
+    producer = Sequence_Producer(generator.new_unpacker(arguments.packer, arguments.random_source, arguments.seed),
+                                 consumers=arguments.players, refill=refill)
+    server = threading.Thread(target=producer.serve, args=(stop,))
+    server.start()
+    results = multiprocessing.Queue()
+    players = [multiprocessing.Process(target=play, args=(producer.name, slot, refill, arguments.placements, slot, results))
+               for slot in range(arguments.players)]
+    for player in players:
+        player.start()
+    sequences = [results.get()[1] for _ in players]
+    for player in players:
+        player.join()
+    stop.set()
+    server.join()
+    producer.close()
+    reference = generator.new_unpacker(arguments.packer, arguments.random_source, arguments.seed)
+    expected = [reference.spawn_next() for _ in range(arguments.placements + 1)]
+    print(f"{arguments.players} players got the same {arguments.placements + 1} pieces:",
+          all(sequence == expected for sequence in sequences))
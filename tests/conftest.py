@@ -0,0 +1,7 @@
+# The modules of absolutris live in the top folder of the repository,
+# which is not a package the tests could import from.
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
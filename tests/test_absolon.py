@@ -0,0 +1,82 @@
+import random
+
+import numpy as np
+import pytest
+
+import absolon
+import old_generator as generator
+
+
+def random_input(engine: absolon.Engine, rng: random.Random) -> int:
+    """
+    Mostly placements within the walls, some garbage and clears.
+    """
+    draw = rng.random()
+    if engine.topped_out or draw < 0.02:
+        return absolon.INPUT_CLEAR
+    if draw < 0.1:
+        return absolon.garbage_input(rng.randrange(engine.board.columns))
+    rotation = rng.randrange(4)
+    return absolon.place_input(rotation, rng.randrange(engine.board.columns - absolon.WIDTHS[engine.piece, rotation] + 1))
+
+
+def counters(board: absolon.Board):
+    return board.fill.copy(), board.features.copy(), board.holes.copy(), board.transitions.copy()
+
+
+def board_of(grid: np.ndarray) -> absolon.Board:
+    board = absolon.Board(*grid.shape)
+    board.grid[:] = grid
+    board.recount()
+    return board
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_incremental_features_equal_recount(seed):
+    rng = random.Random(seed)
+    engine = absolon.Engine(generator.new_unpacker("one_I_in_7_permutation", "pcg64", seed))
+    for _ in range(400):
+        code = random_input(engine, rng)
+        engine.apply(code)
+        if code == absolon.INPUT_CLEAR:
+            engine.topped_out = False
+        incremental = counters(engine.board)
+        engine.board.recount()
+        for kept, recounted in zip(incremental, counters(engine.board)):
+            assert np.array_equal(kept, recounted)
+        assert np.array_equal(engine.board.features, absolon.board_features(engine.board.grid))
+
+
+def test_add_garbage_pushing_out_tops_out():
+    engine = absolon.Engine(generator.new_unpacker("no_rules", "ones", 0), rows=4)
+    engine.board.grid[0, 0] = absolon.GARBAGE
+    engine.board.recount()
+    engine.add_garbage([1])
+    assert engine.topped_out
+    assert np.array_equal(engine.board.grid[-1] == absolon.EMPTY, np.arange(10) == 1)
+
+
+@pytest.mark.parametrize("distinct", (False, True))
+def test_enumerate_placements_equal_place(distinct):
+    rng = random.Random(1)
+    engine = absolon.Engine(generator.new_unpacker("one_I_in_7_permutation", "pcg64", 1))
+    for _ in range(60):
+        grid = engine.board.grid.copy()
+        placements = engine.board.placements(engine.piece, distinct)
+        listed = dict(((rotation, column), index) for index, (rotation, column)
+                      in enumerate(zip(placements.rotations.tolist(), placements.columns.tolist())))
+        rotations = absolon.DISTINCT_ROTATIONS[engine.piece] if distinct else range(4)
+        for rotation in rotations:
+            for column in range(-1, engine.board.columns + 1):
+                board = board_of(grid)
+                placement = board.place(engine.piece, rotation, column)
+                assert (placement is not None) == ((rotation, column) in listed)
+                if placement is not None:
+                    index = listed[rotation, column]
+                    assert np.array_equal(board.grid, placements.boards[index])
+                    assert placement.lines == placements.lines[index]
+                    assert placement.row == placements.rows[index]
+        if not placements.rotations.size:
+            break
+        choice = rng.randrange(placements.rotations.size)
+        engine.step(int(placements.rotations[choice]), int(placements.columns[choice]))
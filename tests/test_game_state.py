@@ -0,0 +1,43 @@
+import random
+
+import numpy as np
+
+import absolon
+import game_state
+import old_generator as generator
+import tournament
+
+
+def test_apply_placement_equals_engine_step():
+    rng = random.Random(4)
+    engine = absolon.Engine(generator.new_unpacker("one_I_in_7_permutation", "pcg64", 4))
+    scratch = generator.new_unpacker("one_I_in_7_permutation", "pcg64", 0)
+    state = game_state.Game_State.from_engine(engine)
+    for _ in range(300):
+        rotation = rng.randrange(4)
+        column = rng.randrange(-1, 11)
+        stack, piece = state.stack, state.piece
+        child = state.apply_placement(rotation, column, scratch)
+        placement = engine.step(rotation, column)
+        assert (child is None) == (placement is None)
+        # the parent never changes
+        assert (state.stack, state.piece) == (stack, piece)
+        if child is None:
+            break
+        assert np.array_equal(child.occupied(), engine.board.grid != absolon.EMPTY)
+        assert (child.piece, child.lines, child.pieces) == (engine.piece, engine.lines, engine.pieces)
+        state = child
+
+
+def test_children_are_the_distinct_placements():
+    engine = absolon.Engine(generator.new_unpacker("one_I_in_7_permutation", "pcg64", 8))
+    unpacker = generator.new_unpacker("one_I_in_7_permutation", "pcg64", 0)
+    for _ in range(20):
+        engine.step(*tournament.greedy_bot(engine.board, engine.piece))
+    state = game_state.Game_State.from_engine(engine)
+    placements = engine.board.placements(engine.piece, distinct=True)
+    children = dict(state.children(unpacker))
+    assert sorted(children) == sorted(zip(placements.rotations.tolist(), placements.columns.tolist()))
+    for index, key in enumerate(zip(placements.rotations.tolist(), placements.columns.tolist())):
+        assert np.array_equal(children[key].occupied(), placements.boards[index] != absolon.EMPTY)
+        assert children[key].lines == engine.lines + placements.lines[index]
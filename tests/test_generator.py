@@ -0,0 +1,78 @@
+import random
+
+import numpy as np
+import pytest
+
+import old_generator as generator
+import generators.primus.primus as primus
+
+
+STREAMS = [("one_I_in_7", "pcg64"), ("one_I_in_7", "randint06"), ("one_I_in_7_permutation", "pcg64"),
+           ("one_I_in_7_permutation", "primus"), ("no_rules", "randint06"), ("seven_ones", "pcg64")]
+
+
+@pytest.mark.parametrize("packer_name, rs_name", STREAMS)
+def test_peek_does_not_advance(packer_name, rs_name):
+    unpacker = generator.new_unpacker(packer_name, rs_name, 7)
+    for spawned in range(30):
+        state = unpacker.snapshot()
+        peeked = unpacker.peek(20)
+        assert unpacker.snapshot() == state
+        assert unpacker.peek(20) == peeked
+        assert tuple(unpacker.preview_next(20)) == peeked
+        assert unpacker.spawn_next() == peeked[0]
+
+
+@pytest.mark.parametrize("packer_name, rs_name", STREAMS)
+def test_restore_repeats_the_stream(packer_name, rs_name):
+    unpacker = generator.new_unpacker(packer_name, rs_name, 11)
+    for _ in range(5):
+        unpacker.spawn_next()
+    state = unpacker.snapshot()
+    first = [unpacker.spawn_next() for _ in range(50)]
+    unpacker.restore(state)
+    assert [unpacker.spawn_next() for _ in range(50)] == first
+
+
+def test_same_seed_same_stream_and_own_state():
+    first = generator.new_unpacker("one_I_in_7", "randint06", 3)
+    second = generator.new_unpacker("one_I_in_7", "randint06", 3)
+    assert [first.spawn_next() for _ in range(70)] == [second.spawn_next() for _ in range(70)]
+
+
+def test_one_I_in_7_packs_by_rejection():
+    own_random = random.Random(5)
+    expected = []
+    while len(expected) < 140:
+        bag = []
+        while len(bag) < 6:
+            number = own_random.randint(0, 6)
+            if number not in bag:
+                bag.append(number)
+        bag.extend(set(range(7)) - set(bag))
+        expected.extend(bag)
+    unpacker = generator.new_unpacker("one_I_in_7", "randint06", 5)
+    assert [unpacker.spawn_next() for _ in range(140)] == expected
+
+
+@pytest.mark.parametrize("packer_name", sorted(generator.packer_dict))
+def test_bags_equal_bag(packer_name):
+    packer = generator.packer_dict[packer_name]
+    bags = packer.bags(generator.Block_Source(9), 20)
+    rs = generator.Block_Source(9)
+    assert bags.tolist() == [list(packer.bag(rs)) for _ in range(20)]
+
+
+def test_primus_digits_are_prime_digits():
+    source = primus.Prime_Digits(segment_size=1 << 12)
+    primes = primus.simple_sieve(200000)
+    assert np.array_equal(source.take(len(primes)), primes % 7)
+
+
+def test_primus_seek_and_set_state():
+    source = primus.Prime_Digits(segment_size=1 << 12)
+    digits = source.take(20000)
+    for k in (15000, 3, 9999, 4095, 19000, 0):
+        source.set_state(k)
+        assert source.tell() == k
+        assert np.array_equal(source.take(1000), digits[k:k + 1000])
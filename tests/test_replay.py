@@ -0,0 +1,72 @@
+import random
+
+import numpy as np
+import pytest
+
+import absolon
+import old_generator as generator
+import replay
+import tournament
+
+
+def record_game(path, rs_name, keyframe_interval, inputs=600):
+    """
+    Records a random game and returns the state of the engine after every frame.
+    """
+    header = replay.Replay_Header(replay.RULESET, "one_I_in_7_permutation", rs_name, 5, 24, 10, 3, 4)
+    engine = absolon.Engine(generator.new_unpacker(header.packer_name, rs_name, header.seed))
+    rng = random.Random(2)
+    states = {}
+    with replay.Recorder(path, header, engine, keyframe_interval) as recorder:
+        for frame in range(1, inputs + 1):
+            draw = rng.random()
+            if engine.board.heights.max() > 16:
+                code = absolon.INPUT_CLEAR
+            elif draw < 0.02:
+                code = absolon.garbage_input(rng.randrange(10))
+            elif draw < 0.1:
+                rotation = rng.randrange(4)
+                code = absolon.place_input(rotation, rng.randrange(11 - absolon.WIDTHS[engine.piece, rotation]))
+            else:
+                code = absolon.place_input(*tournament.greedy_bot(engine.board, engine.piece))
+            engine.apply(code)
+            recorder.record(frame, code)
+            assert not engine.topped_out
+            states[frame] = (engine.board.grid.copy(), engine.piece, engine.lines, engine.pieces, engine.unpacker.peek(14))
+    return engine, states
+
+
+def assert_state(engine, state):
+    grid, piece, lines, pieces, preview = state
+    assert np.array_equal(engine.board.grid, grid)
+    assert (engine.piece, engine.lines, engine.pieces) == (piece, lines, pieces)
+    assert engine.unpacker.peek(14) == preview
+
+
+@pytest.mark.parametrize("rs_name", ("pcg64", "randint06", "primus", "ones"))
+def test_simulate_and_seek_equal_the_game(tmp_path, rs_name):
+    path = tmp_path / ("game" + replay.SUFFIX)
+    engine, states = record_game(path, rs_name, 50)
+    with replay.Replay(path) as recorded:
+        assert len(recorded.index) == 12
+        simulated = replay.simulate(recorded)
+        assert np.array_equal(simulated.board.grid, engine.board.grid)
+        assert (simulated.piece, simulated.lines, simulated.pieces) == (engine.piece, engine.lines, engine.pieces)
+        reused = recorded.engine()
+        for frame in (1, 49, 50, 51, 333, 600, 120, 7):
+            assert_state(recorded.seek(frame), states[frame])
+            reused = recorded.seek(frame, reused)
+            assert_state(reused, states[frame])
+
+
+def test_replay_without_keyframes(tmp_path):
+    path = tmp_path / ("game" + replay.SUFFIX)
+    _, states = record_game(path, "pcg64", 0, inputs=200)
+    with replay.Replay(path) as recorded:
+        assert recorded.index == []
+        assert_state(recorded.seek(150), states[150])
+
+
+def test_unknown_random_source_tag():
+    with pytest.raises(ValueError):
+        replay.decode_rs_state(bytes([200]), 0)
@@ -0,0 +1,150 @@
+# This module draws boards of cells as maps of tiles.
+#
+# The images of all cells, the empty tile, the seven tetrominoes and the
+# garbage, are scaled once to the tile size of the display and put side by
+# side into one atlas surface:
+#
+#   cell     0      1   2   3   4   5   6   7      8
+#   image    empty  I   J   L   O   S   T   Z      garbage
+#
+# The tile size follows from the vertical resolution of the display and the
+# fraction_of_vres of the config, e.g. 1080 / 30 = 36 pixels. A Tile_Atlas
+# keeps its scaled atlases per tile size, so every resolution is scaled
+# only once. The images are flattened onto the background color of the
+# window, so the atlas is opaque and every blit replaces a tile completely,
+# whatever it showed before.
+#
+# A Tile_Map draws a grid of cells on a surface. It remembers which cell
+# every tile shows and blits all tiles which have to change with one call
+# of Surface.blits, whose areas are cut from the atlas. Any number of maps,
+# e.g. the boards of several players, can share one window and one atlas.
+
+import logging
+import logging_conf
+import numpy as np
+import pygame
+from collections import namedtuple
+from typing import Dict, List, Sequence, Tuple
+# own modules
+import absolon
+import old_tetrominoes as tetrominoes
+
+
+# Setup logging
+logging_conf.configure()
+logger = logging.getLogger(__name__)
+
+
+# What Tile_Map.shown holds for tiles whose image is unknown, e.g. after a scroll
+UNKNOWN = 255
+
+Scaled_Atlas = namedtuple("Scaled_Atlas", "surface, tile_size, areas")
+
+
+def cell_images(empty_tile: pygame.Surface, sprite_atlas: tetrominoes.Sprite_Atlas) -> List[pygame.Surface]:
+    """
+    Returns the image of every cell value, see absolon.CELL_NAMES.
+    """
+    images = [empty_tile]
+    images.extend(sprite_atlas[tetrominoes.mapping[piece].color] for piece in range(len(absolon.PIECE_NAMES)))
+    images.append(sprite_atlas[tetrominoes.GARBAGE_COLOR])
+    return images
+
+
+def tile_size(vres: int, fraction_of_vres: int) -> int:
+    return max(vres // fraction_of_vres, 1)
+
+
+class Tile_Atlas():
+    """
+    The images of all cells in one surface per tile size.
+    """
+    def __init__(self, images: Sequence[pygame.Surface], background_color: pygame.Color) -> None:
+        self.images = list(images)
+        self.background_color = background_color
+        self.scaled: Dict[int, Scaled_Atlas] = {}
+    def at(self, size: int) -> Scaled_Atlas:
+        """
+        Returns the atlas with square tiles of size pixels, scaling the images the first time.
+        """
+        atlas = self.scaled.get(size)
+        if atlas is None:
+            logger.debug("Scaling the tile atlas to %d pixels", size)
+            surface = pygame.Surface((size * len(self.images), size))
+            surface.fill(self.background_color)
+            areas = []
+            for cell, image in enumerate(self.images):
+                if image.get_size() != (size, size):
+                    image = pygame.transform.smoothscale(image, (size, size))
+                areas.append(surface.blit(image, (cell * size, 0)))
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert()
+            atlas = Scaled_Atlas(surface, size, areas)
+            self.scaled[size] = atlas
+        return atlas
+
+
+class Tile_Map():
+    """
+    Draws a grid of cells with the top left corner of its first tile on origin.
+    The rects of all blits are added to rects_to_update.
+    """
+    def __init__(self,
+                 surface: pygame.Surface,
+                 origin: Tuple[int, int],
+                 atlas: Scaled_Atlas,
+                 rows: int,
+                 columns: int,
+                 rects_to_update: list) -> None:
+        self.surface = surface
+        self.origin = origin
+        self.atlas = atlas
+        self.tile_width = self.tile_height = atlas.tile_size
+        self.rects_to_update = rects_to_update
+        # what the tiles currently show
+        self.shown = np.full((rows, columns), UNKNOWN, dtype=np.uint8)
+        x, y = origin
+        self.positions = [[(x + column * self.tile_width, y + row * self.tile_height) for column in range(columns)]
+                          for row in range(rows)]
+    def get_rect(self) -> pygame.Rect:
+        rows, columns = self.shown.shape
+        return pygame.Rect(self.origin, (columns * self.tile_width, rows * self.tile_height))
+    def draw(self, grid: np.ndarray) -> None:
+        """
+        Blits the image of every cell which differs from what its tile shows.
+        """
+        changed = np.argwhere(grid != self.shown)
+        if not len(changed):
+            return
+        atlas, areas, positions = self.atlas.surface, self.atlas.areas, self.positions
+        rects = self.surface.blits([(atlas, positions[row][column], areas[cell])
+                                    for (row, column), cell in zip(changed.tolist(), grid[changed[:, 0], changed[:, 1]].tolist())])
+        self.rects_to_update.extendr(rects)
+        self.shown[:] = grid
+    def scroll(self, top: int, bottom: int, rows: int) -> None:
+        """
+        Moves the image of the rows [top, bottom) by rows down, or up if
+        rows is negative, in one blit. Rows moved into keep their image
+        and are marked as UNKNOWN, so draw redraws them.
+        """
+        x, y = self.origin
+        rect = pygame.Rect(x, y + top * self.tile_height,
+                           self.tile_width * self.shown.shape[1], self.tile_height * (bottom - top))
+        # maps may reach beyond the surface, like the blits of draw
+        rect = rect.clip(self.surface.get_rect())
+        if rect:
+            self.surface.subsurface(rect).scroll(0, rows * self.tile_height)
+            self.rects_to_update.appendr(rect)
+        shown = self.shown
+        if rows > 0:
+            shown[top + rows:bottom] = shown[top:bottom - rows].copy()
+            shown[top:top + rows] = UNKNOWN
+        else:
+            shown[top:bottom + rows] = shown[top - rows:bottom].copy()
+            shown[bottom + rows:bottom] = UNKNOWN
+    def first_shown_row(self) -> int:
+        """
+        Returns the topmost row whose tiles do not all show empty cells.
+        """
+        occupied = np.flatnonzero(self.shown.any(axis=1))
+        return int(occupied[0]) if occupied.size else self.shown.shape[0]
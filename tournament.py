@@ -0,0 +1,192 @@
+# This module evaluates bots on many seeds in parallel.
+#
+# A bot is a policy function policy(board, piece) -> (rotation, column)
+# which is given by its dotted name, e.g. "tournament.greedy_bot" or
+# "my_bots.tuned:policy". Every (bot, packer, random source, seed)
+# combination is one headless game on an absolon.Engine whose Unpacker
+# is created by generator.new_unpacker, so a seed always gives the same
+# stream of tetrominoes to every bot.
+#
+# The games are fanned out over a process pool with one worker per core.
+# Tasks are handed out in chunks and results stream back unordered as
+# soon as a chunk is done, then they are aggregated into a summary table
+# per bot, packer and random source.
+
+import csv
+import importlib
+import itertools
+import os
+import random
+import statistics
+import time
+import logging
+import logging_conf
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+# own modules
+import absolon
+import old_generator as generator
+
+
+# Setup logging
+logging_conf.configure()
+# named after the module, also when it runs as the script "__main__"
+logger = logging.getLogger("tournament")
+
+
+Policy = Callable[[absolon.Board, int], Tuple[int, int]]
+
+Task = namedtuple("Task", "policy, packer_name, rs_name, seed, max_pieces")
+# top_out is the number of the frame (one placement per frame) in which
+# the game topped out, or None if it reached max_pieces
+Result = namedtuple("Result", "policy, packer_name, rs_name, seed, lines, pieces, top_out")
+
+# The random numbers of the bundled bots, seeded with the seed of every game,
+# so other code using the random module does not change their results
+bot_random = random.Random()
+
+
+def random_bot(board: absolon.Board, piece: int) -> Tuple[int, int]:
+    """
+    Places the tetromino on a random position within the walls.
+    """
+    rotation = bot_random.randrange(4)
+    return rotation, bot_random.randrange(board.columns - absolon.ROTATIONS[piece][rotation].width + 1)
+
+
+def greedy_bot(board: absolon.Board, piece: int) -> Tuple[int, int]:
+    """
+    Takes the placement which clears the most lines and
+    otherwise keeps the tetromino as low as possible.
+    """
+    placements = board.placements(piece, distinct=True)
+    if not placements.rotations.size:
+        return 0, 0
+    # lines first, then the bottom of the bounding box
+    score = placements.lines * (board.rows + 4) + placements.tops + absolon.HEIGHTS[piece, placements.rotations]
+    best = int(score.argmax())
+    return int(placements.rotations[best]), int(placements.columns[best])
+
+
+@lru_cache(maxsize=None)
+def load_policy(name: str) -> Policy:
+    """
+    Imports a policy given as "package.module.function" or "package.module:function".
+    """
+    module_name, _, function_name = name.rpartition(":") if ":" in name else name.rpartition(".")
+    if not module_name:
+        raise ValueError(f"Policy {name} is not a dotted name")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def play(task: Task) -> Result:
+    """
+    Plays one headless game of a policy.
+    """
+    policy = load_policy(task.policy)
+    bot_random.seed(task.seed)
+    engine = absolon.Engine(generator.new_unpacker(task.packer_name, task.rs_name, task.seed))
+    while engine.pieces < task.max_pieces:
+        rotation, column = policy(engine.board, engine.piece)
+        if engine.step(rotation, column) is None:
+            return Result(task.policy, task.packer_name, task.rs_name, task.seed, engine.lines, engine.pieces, engine.pieces + 1)
+    return Result(task.policy, task.packer_name, task.rs_name, task.seed, engine.lines, engine.pieces, None)
+
+
+def tasks(policies: Iterable[str],
+          packer_names: Iterable[str],
+          rs_names: Iterable[str],
+          seeds: Iterable[int],
+          max_pieces: int) -> Iterator[Task]:
+    for policy, packer_name, rs_name, seed in itertools.product(policies, packer_names, rs_names, seeds):
+        yield Task(policy, packer_name, rs_name, seed, max_pieces)
+
+
+def quiet_worker() -> None:
+    logging_conf.set_subsystem_levels({"engine": "WARNING", "generator": "WARNING"})
+
+
+def run(all_tasks: Iterable[Task], processes: Optional[int] = None, chunksize: int = 64) -> Iterator[Result]:
+    """
+    Plays the tasks on a pool of processes, one per core by default,
+    and yields the results in the order they are finished.
+    """
+    with Pool(processes or os.cpu_count(), initializer=quiet_worker) as pool:
+        yield from pool.imap_unordered(play, all_tasks, chunksize)
+
+
+class Summary():
+    """
+    Aggregates results per policy, packer and random source.
+    """
+    def __init__(self) -> None:
+        self.results: Dict[Tuple[str, str, str], List[Result]] = defaultdict(list)
+    def add(self, result: Result) -> None:
+        self.results[result.policy, result.packer_name, result.rs_name].append(result)
+    def rows(self) -> List[Tuple]:
+        rows = []
+        for key, results in sorted(self.results.items()):
+            lines = [result.lines for result in results]
+            pieces = [result.pieces for result in results]
+            topped_out = sum(result.top_out is not None for result in results)
+            rows.append((*key, len(results), statistics.fmean(lines), statistics.median(lines),
+                         min(lines), max(lines), statistics.fmean(pieces), topped_out / len(results)))
+        return rows
+    def table(self) -> str:
+        header = ("policy", "packer", "random source", "games", "mean lines", "median", "min", "max", "mean pieces", "topped out")
+        cells = [header] + [(policy, packer, rs, f"{games}", f"{mean:.2f}", f"{median:g}", f"{low}", f"{high}",
+                             f"{mean_pieces:.1f}", f"{rate:.1%}")
+                            for policy, packer, rs, games, mean, median, low, high, mean_pieces, rate in self.rows()]
+        widths = [max(len(row[i]) for row in cells) for i in range(len(header))]
+        return "\n".join("  ".join(cell.rjust(width) if i >= 3 else cell.ljust(width)
+                                   for i, (cell, width) in enumerate(zip(row, widths)))
+                         for row in cells)
+
+
+def parse_seeds(text: str) -> Sequence[int]:
+    """
+    Parses "100000" as the seeds 0 to 99999 and "5:10" as 5 to 9.
+    """
+    if ":" in text:
+        start, stop = text.split(":")
+        return range(int(start), int(stop))
+    return range(int(text))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Evaluate bots on many seeds on all cores")
+    parser.add_argument("--policy", action="append", help="dotted name of a policy, can be repeated")
+    parser.add_argument("--seeds", type=parse_seeds, default=range(1000), help="N or START:STOP")
+    parser.add_argument("--packer", action="append", choices=sorted(generator.packer_dict))
+    parser.add_argument("--random-source", action="append", choices=sorted(generator.rs_factories))
+    parser.add_argument("--max-pieces", type=int, default=1000)
+    parser.add_argument("--processes", type=int, help="number of workers, one per core by default")
+    parser.add_argument("--chunksize", type=int, default=64)
+    parser.add_argument("--csv", type=Path, help="also write every result into this file")
+    arguments = parser.parse_args()
+    logging_conf.set_subsystem_levels({"engine": "WARNING", "generator": "WARNING"})
+    all_tasks = tasks(arguments.policy or ["tournament.greedy_bot"],
+                      arguments.packer or ["one_I_in_7_permutation"],
+                      arguments.random_source or ["pcg64"],
+                      arguments.seeds,
+                      arguments.max_pieces)
+    summary = Summary()
+    start = time.perf_counter()
+    csv_file = open(arguments.csv, mode="w", newline="") if arguments.csv else None
+    try:
+        writer = csv.writer(csv_file) if csv_file else None
+        if writer:
+            writer.writerow(Result._fields)
+        for result in run(all_tasks, arguments.processes, arguments.chunksize):
+            summary.add(result)
+            if writer:
+                writer.writerow(result)
+    finally:
+        if csv_file:
+            csv_file.close()
+    print(summary.table())
+    logger.info("Played %d games in %.1f s", sum(len(results) for results in summary.results.values()), time.perf_counter() - start)